@@ -4,6 +4,7 @@ from keycap.helper import KeySizeSpec, KeyMountSpec, KeyMarkSpec, KeyMarkShape
 from keycap.vector import Vec2, Vec3
 from keycap.spec import KeySpec
 from keycap.body import KeyBody
+from keycap.trace import stage
 
 '''
 Galeforce Keycap Profile (GLK)
@@ -29,36 +30,102 @@ or keycap() to fully customize a single cap
 #	- separating out profile generation so you can output keycaps for only one kb
 
 
+FIDELITIES = ('full', 'draft') # see keycap()
+
+
+def checkFidelity(fidelity:str):
+	if fidelity not in FIDELITIES:
+		raise ValueError('unknown fidelity {0!r}; expected one of {1}'.format(fidelity, ', '.join(FIDELITIES)))
+
+
 # generate all unique keys required for GLFC, ErgoDox and 100% keyboards
-def profile(mx:bool=False):
+def profile(mx:bool=False, workers:int=1, cache=None, fidelity:str='full'):
+	checkFidelity(fidelity)
+	specs = profileSpecs(mx)
+	results = dict(buildSpecs(specs, workers, cache, fidelity))
+	return { label: results[label] for label in specs }
+
+
+# build label -> spec, yielding (label, model) as each one is done; keys that only
+# differ by mark share one full build, and get their mark added on top of it
+def buildSpecs(specs:dict, workers:int=1, cache=None, fidelity:str='full'):
+	checkFidelity(fidelity) # here rather than in the generator, so bad calls fail before anything is built
+	return _buildSpecs(specs, workers, cache, fidelity)
+
+
+def _buildSpecs(specs:dict, workers:int, cache, fidelity:str):
+	# bases use keycap()'s own default mark and only pass fidelity when it isn't the
+	# default, so they share cache keys with plain keycap(**vars(spec)) builds
+	variants = {}
+	noMark = defaults().mark
+	for label, spec in specs.items():
+		variants.setdefault(spec.clone(mark=noMark), []).append(label)
+	bases = { labels[0]: base for base, labels in variants.items() }
+	extra = {} if fidelity == 'full' else {'fidelity':fidelity}
+	for label, model in kc.parallel.buildIter(keycap, { label: vars(base) | extra for label, base in bases.items() }, workers, cache):
+		for i, l in enumerate(variants[bases[label]]):
+			if specs[l].mark.shape != KeyMarkShape.NONE and fidelity == 'full':
+				yield l, applyMark(model, specs[l])
+			else:
+				yield l, model if i == 0 else kc.helper.copyModel(model)
+
+
+# per-row body settings of the profile
+rows = {
+	'R4':	{ 'body': {'angle':-2.5,	'height':8}		},	# row4, num row + function row
+	'R3':	{ 'body': {'angle':4.25,	'height':6.5}	},	# row3, qwerty
+	'R2':	{ 'body': {'angle':9,		'height':6.5}	},	# row2, home row
+	'R1':	{ 'body': {'angle':13,		'height':7}		},	# row1, shift/mod row
+}
+
+
+def spec2MX(spec):
+	# skirt height dif 2.5 preplate, 2.9 plate-length skirt ; where did 1.9 come from?
+	# also mx being significantly taller weakens effect of curved wall
+	return spec.clone(body=spec.body.clone(height=spec.body.height+2.9), mount=spec.mount.clone(mxMount=True,mxStem=True))
+
+
+def apply2spec(spec,params):
+	return spec.clone(**{ key: getattr(spec,key).clone(**params.get(key)) for key in set(KeySpec.fields)&set(params) })
+
+
+def makeUnitStr(spec):
+	return str(round(spec.size.units.x*100))+"x"+str(round(spec.size.units.y*100))
+
+
+def makeLabel(spec, rk='R2', mx=False, k={}):
+	return 'GLK_{0}_{1}_{2}{3}'.format('MX' if mx else 'KL', rk, makeUnitStr(spec), "_"+k["PROFILELABEL"] if "PROFILELABEL" in k else "")
+
+
+# spec for a 1U key of row rk, e.g. 'R2'
+def getRowSpec(rk:str='R2', mx:bool=False):
+	rspec = apply2spec(defaults(), rows[rk])
+	return spec2MX(rspec) if mx else rspec
+
+
+# specs for every key in profile(), by label, without building anything
+def profileSpecs(mx:bool=False):
 	df = defaults()
-	u, size = df.size.units, df.body.size
-	# size = df.body.size
-	rows = {
-		'R4':	{ 'top': {'angle':-2.5},	'body': {'size':size.clone(z=8)}	},	# row4, num row + function row
-		'R3':	{ 'top': {'angle':4.25},	'body': {'size':size.clone(z=6.5)}	},	# row3, qwerty
-		'R2':	{ 'top': {'angle':9},		'body': {'size':size.clone(z=6.5)}	},	# row2, home row
-		'R1':	{ 'top': {'angle':13},		'body': {'size':size.clone(z=7)}	},	# row1, shift/mod row
-	}
+	u, edge = df.size.units, df.body.edge
 	keys = {
 		'R4': [
-			{ 'size':{'units':u.clone(x=1)},	'top': {'ratio':0.6,'convex':True},	'edge':{'top':0.15},	"PROFILELABEL":"convex" },		# GLFC inner key (+/-)
+			{ 'size':{'units':u.clone(x=1)},	'body': {'ratio':0.6,'convex':True,'edge':edge.clone(x=0.15)},	"PROFILELABEL":"convex" },		# GLFC inner key (+/-)
 			{ 'size':{'units':u.clone(x=1.15)} },															# GLFC wide tilde
 			{ 'size':{'units':u.clone(x=1.50)} },															# ErgoDox wide tilde
 			# { 'size':{'units':u.clone(x=1.50)},	"unitX":1.50, "height":-1.5,							"PROFILELABEL":"glthumb1" },
 			{ 'size':{'units':u.clone(x=2)} },																# 100% backspace
 		],
 		'R3': [
-			{ 'size':{'units':u.clone(x=1)},	'top': {'ratio':0.6,'convex':True},	'edge':{'top':0.15},	"PROFILELABEL":"convex" },		# GLFC inner key (layer-shift)
+			{ 'size':{'units':u.clone(x=1)},	'body': {'ratio':0.6,'convex':True,'edge':edge.clone(x=0.15)},	"PROFILELABEL":"convex" },		# GLFC inner key (layer-shift)
 			{ 'size':{'units':u.clone(x=1.50)} },																							# tab/pipe
-			{ 'size':{'units':u.clone(x=1.50)},	'top': {'convex':True},	'edge':{'top':0.15},				"PROFILELABEL":"glthumb1" },
+			{ 'size':{'units':u.clone(x=1.50)},	'body': {'convex':True,'edge':edge.clone(x=0.15)},				"PROFILELABEL":"glthumb1" },
 			{ 'size':{'units':u.clone(x=2)},																"PROFILELABEL":"doxthumb" },
 			{ 'size':{'units':u.clone(y=2)},																"PROFILELABEL":"numplen" },		# numpad plus and enter
 		],
 		'R2': [
 			{ 'size':{'units':u.clone(x=1)},	'mark':{'shape':KeyMarkShape.DOTS},							"PROFILELABEL":"home" },		# homing key, numpad 5
 			{ 'size':{'units':u.clone(x=1.50)} },															# GLFC/ErgoDox side key
-			{ 'size':{'units':u.clone(x=1.50)},	'top': {'convex':True},	'edge':{'top':0.15}, 'body': {'size':size.clone(z=7)},				"PROFILELABEL":"glthumb2" },
+			{ 'size':{'units':u.clone(x=1.50)},	'body': {'convex':True,'edge':edge.clone(x=0.15),'height':7},	"PROFILELABEL":"glthumb2" },
 			{ 'size':{'units':u.clone(x=1.75)},																"PROFILELABEL":"caps" },
 			{ 'size':{'units':u.clone(x=2.25)},																"PROFILELABEL":"enter" },
 		],
@@ -69,36 +136,19 @@ def profile(mx:bool=False):
 			{ 'size':{'units':u.clone(x=2)},																"PROFILELABEL":"num0" },
 			{ 'size':{'units':u.clone(x=2.25)},																"PROFILELABEL":"LShift" },
 			{ 'size':{'units':u.clone(x=2.75)},																"PROFILELABEL":"RShift" },
-			{ 'size':{'units':u.clone(x=2)},	'top': {'angle':9,'ratio':0.6,'convex':True}, 'edge':{'top':0.15},	"PROFILELABEL":"space" },		# GLFC spacebar
-			{ 'size':{'units':u.clone(x=6.25)},	'top': {'angle':9,'ratio':0.6,'convex':True}, 'edge':{'top':0.15},	"PROFILELABEL":"space" },		# 100% spacebar
+			{ 'size':{'units':u.clone(x=2)},	'body': {'angle':9,'ratio':0.6,'convex':True,'edge':edge.clone(x=0.15)},	"PROFILELABEL":"space" },		# GLFC spacebar
+			{ 'size':{'units':u.clone(x=6.25)},	'body': {'angle':9,'ratio':0.6,'convex':True,'edge':edge.clone(x=0.15)},	"PROFILELABEL":"space" },		# 100% spacebar
 		],
 	}
-	def spec2MX(spec):
-		# skirt height dif 2.5 preplate, 2.9 plate-length skirt ; where did 1.9 come from?
-		# also mx being significantly taller weakens effect of curved wall
-		spec.body.size += Vec3(0,0,2.9)
-		spec.mount = spec.mount.clone(mxMount=True,mxStem=True)
-		return spec
-	def apply2spec(spec,params):
-		new = spec.clone()
-		for key in set(keycap.__code__.co_varnames)&set(params):
-			setattr(new, key, getattr(new,key).clone(**params.get(key)))
-		return new
-	def makeUnitStr(spec):
-		return str(round(spec.size.units.x*100))+"x"+str(round(spec.size.units.y*100))
-	def makeLabel(spec, rk='R2', mx=False, k={}):
-		return 'GLK_{0}_{1}_{2}{3}'.format('MX' if mx else 'KL', rk, makeUnitStr(spec), "_"+k["PROFILELABEL"] if "PROFILELABEL" in k else "")
-
-	keycaps = {}
+	specs = {}
 	for rk in rows.keys():
-		rspec = apply2spec(df, rows[rk])
-		if mx: rspec = spec2MX(rspec)
-		keycaps |= { makeLabel(rspec, rk, mx): keycap(**vars(rspec)) }
+		rspec = getRowSpec(rk, mx)
+		specs |= { makeLabel(rspec, rk, mx): rspec }
 		for k in keys[rk]:
 			kspec = apply2spec(rspec, k)
-			keycaps |= { makeLabel(kspec, rk, mx, k): keycap(**vars(kspec)) }
+			specs |= { makeLabel(kspec, rk, mx, k): kspec }
 
-	return keycaps
+	return specs
 
 	
 # full keycap customization; defaults to a 1U home row key
@@ -125,52 +175,84 @@ def keycap(
 		shape=KeyMarkShape.NONE,
 		offset=Vec2(y=1.0/6),
 	),
+	hollow:str = 'loft',	# how to hollow out the top; 'loft' or 'offset', see mount.makeTopNegative()
+	fidelity:str = 'full',	# 'draft' stops after the scoop; exact outer shape, no finishing, for fast previews
 ):
 	
+	checkFidelity(fidelity)
 	spec:KeySpec =	KeySpec(**locals())
 	
 	
 	# CORE SHAPE
 	
-	core = body.makeCore(size.getCoreSize())
-	scoop = body.makeScoop(size.getCoreSize()).translate((0, -body.offset.y, body.height))
+	ctx = kc.context.BuildContext(spec) # shares the mount negative and scoop with makeTopNeg()
+	with stage('core') as s:
+		core = s.out(ctx.core)
+	with stage('scoop') as s:
+		scoop = s.out(ctx.scoop)
+
+	with stage('scoop_cut', core) as s:
+		keycap = s.out(ctx.outer)
 
-	keycap = core - scoop
-	keycap = body.applyEdgeFinish(keycap, size)
+	if fidelity == 'draft':
+		return keycap
+	with stage('edge_fillet', keycap) as s:
+		keycap = s.out(body.applyEdgeFillet(keycap, size))
+
+	# everything from here on is collected and applied as one cut and one fuse
+	booleans = kc.boolean.BooleanBatch()
+	with stage('edge_cut') as s:
+		booleans.cut(s.out(body.makeEdgeBotCut(size))) # manual bottom chamfer, auto one is bad
 
 
 	# HOMING/WIN-KEY FEATURES
 
-	if mark.shape == KeyMarkShape.WINDOWS:
-		keycap = kc.homing.addInsetBulb(keycap, spec)
-	if mark.shape == KeyMarkShape.DOTS:
-		keycap = kc.homing.addDots1(keycap, spec)
+	with stage('mark'):
+		addMarkTools(booleans, spec)
 
 	
 	# MOUNT CUTOUT
 	
 	mountH = kc.mount.getSkirtHeight(mount.mxMount, False)
-	mountCut = kc.mount.makeCherryNeg(spec.size) if mount.mxMount else kc.mount.makeChocNeg(spec.size)
-	mountTopCut = kc.mount.makeTopNeg(spec)
-
-	keycap -= (mountCut+mountTopCut)
+	with stage('mount_neg') as s:
+		booleans.cut(s.out(ctx.mountNeg))
+	with stage('top_neg') as s:
+		booleans.cut(s.out(kc.mount.makeTopNeg(spec, ctx=ctx, method=hollow)))
 	
 	
 	# STEM / STABILIZER
 	
-	stem = (kc.mount.makeCherryStem(isBox=True) if mount.mxMount else kc.mount.makeChocStem()).translate((0, 0, mountH))
-
-	if mount.stab and mount.stabIsPOS:
-		keycap += kc.stabilizer.makePOSStabilizer1(stem, size)
-	elif mount.stab and kc.stabilizer.canStabilize1(size.units):
-		keycap += stem + kc.stabilizer.makeStabilizer1(spec).translate((0, 0, mountH))
-	else:
-		keycap += stem
+	with stage('stem') as s:
+		stem = s.out((kc.mount.makeCherryStem(isBox=True) if mount.mxMount else kc.mount.makeChocStem()).translate((0, 0, mountH)))
+		if mount.stab and mount.stabIsPOS:
+			booleans.fuse(kc.stabilizer.makePOSStabilizer1(stem, size))
+		elif mount.stab and kc.stabilizer.canStabilize1(size.units):
+			booleans.fuse(stem, kc.stabilizer.makeStabilizer1(spec).translate((0, 0, mountH)))
+		else:
+			booleans.fuse(stem)
+
+	with stage('booleans', keycap) as s:
+		keycap = s.out(booleans.apply(keycap))
 	
 	
 	# OUTPUT
 	
 	return keycap
 
+# collect the homing/win-key feature tools for spec into a BooleanBatch
+def addMarkTools(booleans, spec:KeySpec):
+	if spec.mark.shape == KeyMarkShape.WINDOWS:
+		bulbCut, bulb = kc.homing.makeInsetBulb(spec)
+		booleans.cut(bulbCut).fuse(bulb)
+	if spec.mark.shape == KeyMarkShape.DOTS:
+		booleans.fuse(kc.homing.makeDots1(spec))
+	return booleans
+
+# add the homing/win-key features of spec to an already built, unmarked keycap
+def applyMark(model, spec:KeySpec):
+	with stage('mark') as s:
+		return s.out(addMarkTools(kc.boolean.BooleanBatch(), spec).apply(model))
+
 def defaults():
-	return KeySpec(**{keycap.__code__.co_varnames[n]: keycap.__defaults__[n].clone() for n in range(keycap.__code__.co_argcount)})
\ No newline at end of file
+	args = dict(zip(keycap.__code__.co_varnames, keycap.__defaults__))
+	return KeySpec(**{ f: args[f] for f in KeySpec.fields })
\ No newline at end of file
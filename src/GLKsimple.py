@@ -1,6 +1,8 @@
 from cadquery import selectors as sel
 import cadquery as cq
-from keycap import body, homing, mount, stabilizer
+from keycap import body, homing, mount, stabilizer, parallel
+from keycap.helper import memoizeModel
+from keycap.trace import stage
 
 '''
 Galeforce Simplified Keycap Profile (GLK-S)
@@ -16,7 +18,12 @@ unnecessary material removed.
 
 
 # generate all unique keys required for GLFC, ErgoDox and 100% keyboards
-def profile(mx:bool=False):
+def profile(mx:bool=False, workers:int=1, cache=None):
+	return parallel.buildMany(keycap, profileArgs(mx), workers, cache)
+
+
+# keycap() arguments for every key in profile(), by label, without building anything
+def profileArgs(mx:bool=False):
 	rows = [
 		{ "scoopAngle":-2.5,	"height":4.7,	"ROWLABEL":"R4" },		# row4, num row + function row
 		{ "scoopAngle":3,		"height":3.2,	"ROWLABEL":"R3" },		# row3, qwerty
@@ -63,7 +70,7 @@ def profile(mx:bool=False):
 		MX = { "mountIsMX":True, "stemIsMX":True } # don't need height offset because there is no skirt
 		return { k: args.get(k,0)+MX.get(k,0) if type(args.get(k)) not in [bool, str] else MX.get(k) if k in MX else args.get(k) for k in set(args)|set(MX) }
 	
-	keycaps = {}
+	jobs = {}
 	prefix = "GLKS_"
 	prefix += "MX_" if mx else "KL_"
 	for i, r in enumerate(rows):
@@ -72,9 +79,63 @@ def profile(mx:bool=False):
 			args = r|k if not mx else args2MX(r|k)
 			label += str(round(args.get("unitX",1)*100))+"x"+str(round(args.get("unitY",1)*100))+("_"+k["PROFILELABEL"] if "PROFILELABEL" in k else "")
 			args = { k: args.get(k) for k in set(keycap.__code__.co_varnames)&set(args) }
-			keycaps |= { label: keycap(**args) }
+			jobs |= { label: args }
 	
-	return keycaps
+	return jobs
+
+
+# SHARED GEOMETRY
+# keys in a row only differ in size, and rows share sizes, so the core, scoop
+# and ceiling are memoized on just the settings each one depends on
+
+@memoizeModel(maxsize=64)
+def makeCore(midX:float, midY:float, midFil:float, coreH:float):
+	return cq.CQ( cq.Solid.makeBox(midX,midY,coreH,(-midX/2,-midY/2,-coreH/2),(0,0,1)) ).edges("|Z").fillet(midFil)
+
+
+@memoizeModel(maxsize=64)
+def makeScoopFace(scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH):
+	# the core is a vertical prism, so cutting it at height directly gives the same face
+	# as cutting higher up and moving the result down
+	scoop_plane = body.makeScoop(scoopAngle, scoopDepth, scoopRatio, botX, botY, scoopConvex, planeOnly=True).translate((0, -topOff, height))
+	return makeCore(midX, midY, midFil, coreH).intersect(scoop_plane)
+
+
+def getScoopWire(scoopArgs:tuple, z:float=0) -> cq.Wire:
+	wire = makeScoopFace(*scoopArgs).wires().val()
+	return wire.translate(cq.Vector(0, 0, z)) if z else wire
+
+
+@memoizeModel(maxsize=64)
+def makeScoopTop(scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH, scoopH, edgeTopChm, edgeBotFil):
+	scoopArgs = (scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH)
+	return (
+		cq.CQ(cq.Solid.makeLoft([getScoopWire(scoopArgs, -scoopH), getScoopWire(scoopArgs)]))
+		.faces(sel.NearestToPointSelector((0, -topOff, height+0.1))).edges().chamfer(edgeTopChm)
+		.faces(sel.NearestToPointSelector((0, 0, -0.1))).edges().fillet(edgeBotFil)
+	)
+
+
+@memoizeModel(maxsize=64)
+def makeCeilingCore(midX, midY, midFil, coreH, ceilX, ceilY, ceilDia, ceilAng):
+	core = makeCore(midX, midY, midFil, coreH)
+	ceil_rect = cq.CQ("XY").rect(ceilX,ceilY)
+	ceil_path = ceil_rect.val().fillet2D(ceilDia/4, ceil_rect.vertices().vals())
+	return core - ( cq.CQ("YZ")
+		.moveTo(max(midX,midY), -coreH-0.0001)
+		.hLineTo(ceilY/2)
+		.vLineTo(0)
+		.polarLine(coreH*2, 90-ceilAng)
+		.hLineTo(max(midX,midY))
+		.close().sweep(ceil_path)
+	) - core.translate((0,0,-coreH/2))
+
+
+@memoizeModel(maxsize=64)
+def makeCeiling(scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH, scoopH, ceilX, ceilY, ceilDia, ceilAng):
+	scoopArgs = (scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH)
+	ceilscoop_loft = cq.CQ(cq.Solid.makeLoft([getScoopWire(scoopArgs, -coreH), getScoopWire(scoopArgs, -scoopH/2)], True))
+	return makeCeilingCore(midX, midY, midFil, coreH, ceilX, ceilY, ceilDia, ceilAng).intersect(ceilscoop_loft)
 
 	
 # full keycap customization; defaults to a 1U home row key
@@ -143,45 +204,27 @@ def keycap(
 	# CORE SHAPE
 	
 	# core = body.makeCore(topX, topY, botX, botY, height+mountH, wallCurve, scoopAngle, topOff, topFil, baseFil)
-	core = cq.CQ( cq.Solid.makeBox(midX,midY,coreH,(-midX/2,-midY/2,-coreH/2),(0,0,1)) ).edges("|Z").fillet(midFil)
-	
-	scoop_plane =	body.makeScoop(scoopAngle, scoopDepth, scoopRatio, botX, botY, scoopConvex, planeOnly=True).translate((0, -topOff, height+mountH/2))
-	scoop_face =	core.intersect(scoop_plane).translate((0,0,-mountH/2))
-	scoop_wire1 =	scoop_face.translate((0,0,-scoopH)).wires().val()
-	scoop_wire2 =	scoop_face.wires().val()
-	scoop =			(
-		cq.CQ(cq.Solid.makeLoft([scoop_wire1,scoop_wire2]))
-		.faces(sel.NearestToPointSelector((0, -topOff, height+0.1))).edges().chamfer(edgeTopChm)
-		.faces(sel.NearestToPointSelector((0, 0, -0.1))).edges().fillet(edgeBotFil)
-	)
-	scoopTopFace = cq.CQ(scoop.faces(sel.NearestToPointSelector((0, -topOff, height+0.1))).val())
-	scoopBotFace = cq.CQ(scoop.faces(sel.NearestToPointSelector((0, 0, -0.1))).val())
+	# the core itself is only needed by the memoized scoop and ceiling builders below
+	scoopArgs = (scoopAngle, scoopDepth, scoopRatio, scoopConvex, botX, botY, topOff, height, midX, midY, midFil, coreH)
+	with stage('scoop') as s:
+		scoop = s.out(makeScoopTop(*scoopArgs, scoopH, edgeTopChm, edgeBotFil))
 	
-	ceil_rect =			cq.CQ("XY").rect(ceilX,ceilY)
-	ceil_path =			ceil_rect.val().fillet2D(ceilDia/4, ceil_rect.vertices().vals())
-	ceil_core = 		core - ( cq.CQ("YZ")
-		.moveTo(max(midX,midY), -coreH-0.0001)
-		.hLineTo(ceilY/2)
-		.vLineTo(0)
-		.polarLine(coreH*2, 90-ceilAng)
-		.hLineTo(max(midX,midY))
-		.close().sweep(ceil_path)
-	) - core.translate((0,0,-coreH/2))
-	ceilscoop_wire1 =	scoop_face.translate((0,0,-coreH)).wires().val()
-	ceilscoop_wire2 =	scoop_face.translate((0,0,-scoopH/2)).wires().val()
-	ceilscoop_loft =	cq.CQ(cq.Solid.makeLoft([ceilscoop_wire1,ceilscoop_wire2], True))
-	ceil =				ceil_core.intersect(ceilscoop_loft)
+	with stage('ceil') as s:
+		ceil = s.out(makeCeiling(*scoopArgs, scoopH, ceilX, ceilY, ceilDia, ceilAng))
 
-	keycap = scoop + ceil
+	with stage('ceil_fuse', scoop) as s:
+		keycap = s.out(scoop + ceil)
 
 
 	# HOMING/WIN-KEY FEATURES
 	
-	if isOS:
-		keycap = homing.addWinBulb(keycap, height, topOff, scoopAngle, scoopConvex)
-		
-	if isHoming:
-		keycap = homing.addDots(keycap, homeDotCnt, homeDotRad, homeRad, height, topOff, scoopAngle)
+	with stage('mark', keycap) as s:
+		if isOS:
+			keycap = homing.addWinBulb(keycap, height, topOff, scoopAngle, scoopConvex)
+			
+		if isHoming:
+			keycap = homing.addDots(keycap, homeDotCnt, homeDotRad, homeRad, height, topOff, scoopAngle)
+		s.out(keycap)
 	
 	
 	# MOUNT CUTOUT
@@ -190,28 +233,34 @@ def keycap(
 	cutout = None
 	mountMinX = stabilizer.getMinNegU(stabilizer.getStabLen(unitX, uX, mountIsMX, stabIsPOS), uX)
 	mountMinY = stabilizer.getMinNegU(stabilizer.getStabLen(unitY, uY, mountIsMX, stabIsPOS), uY)
-	if mountIsMX:
-		cutoutH = mount.getCherrySkirtHeight(True)
-		cutout = mount.makeCherryNegative(uX, mountMinX, uY, mountMinY)
-	else:
-		cutoutH = mount.getChocSkirtHeight(False)
-		cutout = mount.makeChocNegative(uX, mountMinX, uY, mountMinY)
+	with stage('mount_neg') as s:
+		if mountIsMX:
+			cutoutH = mount.getCherrySkirtHeight(True)
+			cutout = mount.makeCherryNegative(uX, mountMinX, uY, mountMinY)
+		else:
+			cutoutH = mount.getChocSkirtHeight(False)
+			cutout = mount.makeChocNegative(uX, mountMinX, uY, mountMinY)
+		s.out(cutout)
 
-	keycap -= cutout.translate((0,0,-mountH))
+	with stage('mount_cut', keycap) as s:
+		keycap = s.out(keycap - cutout.translate((0,0,-mountH)))
 	
 	
 	# STEM / STABILIZER
 	
-	stem = mount.makeCherryStem() if stemIsMX else mount.makeChocStem()
-	if stabIsPOS:
-		keycap += stabilizer.makePOSStabilizer(stem, uX, unitX, uY, unitY)
-	elif stab and stabilizer.canStabilize(unitX, unitY):
-		keycap += stem + stabilizer.makeStabilizer(unitX, unitY, not mountIsMX)
-	else:
-		keycap += stem
+	with stage('stem') as s:
+		stem = s.out(mount.makeCherryStem() if stemIsMX else mount.makeChocStem())
+	with stage('stem_fuse', keycap) as s:
+		if stabIsPOS:
+			keycap += stabilizer.makePOSStabilizer(stem, uX, unitX, uY, unitY)
+		elif stab and stabilizer.canStabilize(unitX, unitY):
+			keycap += stem + stabilizer.makeStabilizer(unitX, unitY, not mountIsMX)
+		else:
+			keycap += stem
+		s.out(keycap)
 	
 	
 	# OUTPUT
 	
 	return keycap
-	# return {0:keycap,1:core,2:scoop_plane,3:scoopTopFace,4:scoopBotFace,5:scoop}
\ No newline at end of file
+	# return {0:keycap,1:scoop,2:ceil}
\ No newline at end of file
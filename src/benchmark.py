@@ -0,0 +1,189 @@
+import GLK, GLKsimple
+import json
+import math
+import platform
+import argparse
+import statistics
+from time import perf_counter, strftime
+import cadquery as cq
+from keycap import trace, boolean
+from keycap.context import BuildContext
+from keycap.mount import makeTopNegative
+from keycap.helper import clearModelCaches
+
+
+'''
+Stage-level benchmark for the keycap() pipelines.
+
+Builds every key in GLK.profile() and GLKsimple.profile(), both KL and
+MX, several times and reports per-stage median/p95 timings. Results are
+saved as JSON and can be compared against a stored baseline, e.g.
+
+	python benchmark.py --repeat 3 --out bench/base.json
+	python benchmark.py --repeat 3 --baseline bench/base.json
+
+To measure batched booleans (keycap.boolean) against one boolean per tool:
+
+	python benchmark.py --sets GLK --serial-booleans --out bench/serial.json
+	python benchmark.py --sets GLK --baseline bench/serial.json
+
+--hollow additionally times mount.makeTopNegative() per hollowing method on
+every GLK key and samples the resulting top wall thickness.
+
+With --trace, every span (including its face/edge and boolean counts)
+is also written as a Chrome trace for chrome://tracing or Perfetto.
+'''
+
+
+def getCorpus(sets:list[str]) -> dict:
+	corpus = {}
+	for mx in (False, True):
+		if 'GLK' in sets:
+			corpus |= { label: (GLK.keycap, vars(spec)) for label, spec in GLK.profileSpecs(mx).items() }
+		if 'GLKS' in sets:
+			corpus |= { label: (GLKsimple.keycap, args) for label, args in GLKsimple.profileArgs(mx).items() }
+	return corpus
+
+
+def percentile(values:list[float], p:float) -> float:
+	# nearest-rank, so it is always an observed value
+	v = sorted(values)
+	return v[max(0, math.ceil(p/100*len(v))-1)]
+
+
+def summarize(samples:list[float]) -> dict:
+	return { 'n':len(samples), 'median':statistics.median(samples), 'p95':percentile(samples, 95), 'total':sum(samples) }
+
+
+def run(corpus:dict, repeat:int=3, cold:bool=False, tracer:trace.Tracer=None, log=print) -> dict:
+	'''
+	Build the corpus repeat times and return per-stage stats for single calls
+	('calls') and for whole-corpus totals per run ('runs'), in seconds. If a
+	tracer is given, it also receives every span.
+	'''
+	calls, runs = {}, {}
+	for i in range(repeat):
+		if cold: clearModelCaches()
+		totals = {}
+		for label, (fn, kwargs) in corpus.items():
+			with trace.recording() as r:
+				t = perf_counter()
+				if tracer is not None:
+					with trace.recording(tracer):
+						fn(**kwargs)
+				else:
+					fn(**kwargs)
+				r.add('total', perf_counter()-t)
+			for name, times in r.times.items():
+				calls.setdefault(name, []).extend(times)
+				totals[name] = totals.get(name, 0) + sum(times)
+		for name, t in totals.items():
+			runs.setdefault(name, []).append(t)
+		log('run {0}/{1}: {2:.2f}s'.format(i+1, repeat, totals['total']))
+	return {
+		'calls':	{ name: summarize(t) for name, t in calls.items() },
+		'runs':		{ name: summarize(t) for name, t in runs.items() },
+	}
+
+
+def getWallThickness(spec, negative, samples:int=5) -> list[float]:
+	# distance from a grid of points on the top surface to the hollow below it
+	top = spec.body.getTopSize(spec.size.getCoreSize())
+	grid = [(i/(samples-1)-0.5)*0.6 for i in range(samples)]
+	x, u = zip(*[(top.x*gx, top.y*gu) for gx in grid for gu in grid])
+	surface = spec.body.getScoopSurface(spec.size.getCoreSize())
+	shape = negative.findSolid()
+	return [shape.distance(cq.Vertex.makeVertex(*p.toTuple())) for p in surface.getPoints(x, u)]
+
+
+def compareHollow(specs:dict, methods=('loft', 'offset'), thickness:float=1.2, log=print) -> dict:
+	'''
+	Build the top negative of every spec with each hollowing method, returning
+	per-method build time and wall thickness stats (s, mm). Failed builds are counted.
+	'''
+	times, walls, failed = { m: [] for m in methods }, { m: [] for m in methods }, { m: 0 for m in methods }
+	for label, spec in specs.items():
+		for m in methods:
+			ctx = BuildContext(spec, thickness)
+			for shared in ('mountNegWire', 'outer'): # keycap() builds these anyway
+				getattr(ctx, shared)
+			try:
+				t = perf_counter()
+				negative = makeTopNegative(spec, thickness, ctx, m)
+				times[m].append(perf_counter()-t)
+				walls[m] += getWallThickness(spec, negative)
+			except Exception as e:
+				failed[m] += 1
+				log('{0} ({1}) failed: {2}'.format(label, m, e))
+	return { m: {
+		'time':		summarize(times[m]) if times[m] else None,
+		'wall':		{ 'min':min(walls[m]), 'median':statistics.median(walls[m]), 'max':max(walls[m]) } if walls[m] else None,
+		'failed':	failed[m],
+	} for m in methods }
+
+
+def reportHollow(result:dict, thickness:float=1.2) -> str:
+	lines = ['{0:<8}{1:>11}{2:>11}{3:>10}{4:>10}{5:>10}{6:>8}'.format('method', 'median ms', 'p95 ms', 'wall min', 'wall med', 'wall max', 'failed')]
+	for m, r in result.items():
+		t, w = r['time'] or { 'median':math.nan, 'p95':math.nan }, r['wall'] or { 'min':math.nan, 'median':math.nan, 'max':math.nan }
+		lines.append('{0:<8}{1:>11.2f}{2:>11.2f}{3:>10.3f}{4:>10.3f}{5:>10.3f}{6:>8}'.format(
+			m, t['median']*1000, t['p95']*1000, w['min'], w['median'], w['max'], r['failed']))
+	return '\n'.join(lines+['(target wall {0}mm; supports under the top make the max overshoot)'.format(thickness)])
+
+
+def report(result:dict, baseline:dict=None) -> str:
+	lines = ['{0:<14}{1:>6}{2:>11}{3:>11}{4:>11}{5:>11}'.format('stage', 'calls', 'median ms', 'p95 ms', 'run med s', 'vs base')]
+	calls, runs = result['stats']['calls'], result['stats']['runs']
+	for name in sorted(calls, key=lambda n : -runs[n]['median']):
+		diff = ''
+		if baseline is not None and name in baseline['stats']['runs']:
+			base = baseline['stats']['runs'][name]['median']
+			diff = '{0:+.1%}'.format(runs[name]['median']/base-1) if base else ''
+		lines.append('{0:<14}{1:>6}{2:>11.2f}{3:>11.2f}{4:>11.3f}{5:>11}'.format(
+			name, calls[name]['n'], calls[name]['median']*1000, calls[name]['p95']*1000, runs[name]['median'], diff))
+	return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Stage-level benchmark for the keycap() pipelines.')
+	parser.add_argument('--repeat', type=int, default=3, help='times to build the full corpus')
+	parser.add_argument('--sets', nargs='+', default=['GLK', 'GLKS'], choices=['GLK', 'GLKS'], help='profiles to include')
+	parser.add_argument('--cold', action='store_true', help='clear memoized components before every run')
+	parser.add_argument('--out', default='benchmark.json', help='where to save results')
+	parser.add_argument('--baseline', help='previous results to compare against')
+	parser.add_argument('--serial-booleans', action='store_true', help='apply batched booleans one tool at a time')
+	parser.add_argument('--hollow', action='store_true', help='also compare hollowing methods of the top negative')
+	parser.add_argument('--trace', help='also save a Chrome trace of every span here')
+	args = parser.parse_args()
+
+	boolean.BATCHED = not args.serial_booleans
+	corpus = getCorpus(args.sets)
+	tracer = trace.Tracer() if args.trace else None
+	print('benchmarking {0} keys x {1}'.format(len(corpus), args.repeat))
+	result = {
+		'meta': {
+			'time':		strftime('%Y-%m-%dT%H:%M:%S'),
+			'python':	platform.python_version(),
+			'machine':	platform.machine(),
+			'sets':		args.sets,
+			'repeat':	args.repeat,
+			'cold':		args.cold,
+			'batched':	boolean.BATCHED,
+			'keys':		len(corpus),
+		},
+		'stats': run(corpus, args.repeat, args.cold, tracer),
+	}
+	if args.hollow:
+		result['hollow'] = compareHollow({ label: spec for mx in (False, True) for label, spec in GLK.profileSpecs(mx).items() })
+	with open(args.out, 'w') as f:
+		json.dump(result, f, indent='\t')
+	if tracer is not None:
+		tracer.saveChrome(args.trace)
+
+	baseline = None
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	print(report(result, baseline))
+	if args.hollow:
+		print(reportHollow(result['hollow']))
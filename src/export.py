@@ -1,6 +1,16 @@
 import GLK, GLKsimple
 import cadquery as cq
-from cadquery import exporters
+from keycap.cache import BrepCache, getHash, getSourceVersion
+from keycap.manifest import ExportManifest
+from keycap.parallel import buildIter, exportJob, shape2brep
+from keycap import mesh
+from keycap.plate import PlatePacker
+from keycap.supports import SupportPlanner
+from keycap.helper import makeInstancedAssembly
+from keycap.vector import Vec2
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from os import makedirs
 from os.path import dirname, abspath
 
 
@@ -13,45 +23,148 @@ except ModuleNotFoundError:
 # export settings
 exportSTL =			True
 exportSTEP =	 	True
+exportPLY =			False	# indexed mesh with welded vertices
 exportIndividual =	False
 exportAssembly =	False
+exportPlates =		False	# whole set tilted and packed onto build plates, one STL/PLY per plate
+incremental =		True	# only rebuild/rewrite keys whose inputs or outputs changed since the last run
 export_pre =	'{0}/../export/preview'.format(dirname(abspath(__file__)))
 
+# cache settings
+useCache =		True
+cacheDir =		'{0}/../.cache/brep'.format(dirname(abspath(__file__)))
+cacheMaxMB =	512
+
 # STL settings
 tol = 0.001
 tolAng = 0.05		# 0.025 decent quality/size trade-off; 0.01 for obscene quality
+adaptive = True		# adaptiveTol bounds the chord error on every face, so each is only as fine as its curvature needs; tolAng is the coarsest step any face gets
+adaptiveTol = 0.005	# max distance (mm) between mesh and surface when adaptive
+meshTol = adaptiveTol if adaptive else tol
+
+# plate settings
+plateSize =		Vec2(143, 89)	# usable build plate area (mm)
+plateSpacing =	2.0
+plateTilt =		35
+plateSupports =	True			# add SupportPlanner supports to every cap, using workers and the cache; False leaves supports to the slicer
+plateLift =		5.0				# room under each cap for supports, if plateSupports
 
 
 # choose your character
 exportMX =		False
 exportSimple =	False
+workers =		1			# >1 to build keys in parallel processes
+writers =		2			# processes tessellating/writing finished keys while the rest build
+cache =			BrepCache(cacheDir, cacheMaxMB*1024*1024) if useCache else None
 prefix =		("GLKS_" if exportSimple else "GLK_") + ("MX_" if exportMX else "KL_")
-keycaps =		GLKsimple.profile(mx=exportMX) if exportSimple else GLK.profile(mx=exportMX)
+generator =		GLKsimple.keycap if exportSimple else GLK.keycap
+specs =			None if exportSimple else GLK.profileSpecs(mx=exportMX)
+jobs =			GLKsimple.profileArgs(mx=exportMX) if exportSimple else { k: vars(v) for k, v in specs.items() }
+
+
+# work out which keys actually need writing
+if exportPLY: makedirs('./export/PLY', exist_ok=True)
+manifest =		ExportManifest('./export/'+prefix+'manifest.json')
+source =		getSourceVersion(generator)
+outputs =		{ name: (['./export/STL/' + name + '.stl'] if exportSTL else []) + (['./export/STEP/' + name + '.step'] if exportSTEP else []) + (['./export/PLY/' + name + '.ply'] if exportPLY else []) for name in jobs }
+specHashes =	{ name: getHash({ 'args':jobs[name], 'tol':meshTol, 'tolAng':tolAng, 'adaptive':adaptive }) for name in jobs }
+stale =			[name for name in jobs if not (incremental and manifest.isCurrent(name, specHashes[name], source, outputs[name]))] if exportIndividual else []
+removed =		manifest.prune(jobs) if exportIndividual else []
+todo =			jobs if exportAssembly or exportPlates else { name: jobs[name] for name in stale }
+
+
+# warn about settings that won't write anything
+if exportPlates and not (exportSTL or exportPLY):
+	print('exportPlates needs exportSTL or exportPLY; no plates will be written')
 
 
-assembly = cq.Assembly()
+# build keys, handing each one to the writers as soon as it is done
+timings = { 'build':0.0, 'load':0.0, 'mesh':0.0, 'stl':0.0, 'ply':0.0, 'step':0.0, 'assembly':0.0, 'plates':0.0 }
+start = perf_counter()
+keycaps = {}
+meshes = {} # meshes the writers made, reused for the assembly and plates
+keepMesh = (exportAssembly or exportPlates and not plateSupports) and (exportSTL or exportPLY)
+with ProcessPoolExecutor(max_workers=writers) as pool:
+	writes = {}
+	t = perf_counter()
+	builds = buildIter(generator, todo, workers, cache) if exportSimple else GLK.buildSpecs({ name: specs[name] for name in todo }, workers, cache)
+	for name, cap in builds:
+		keycaps[name] = cap
+		if name in stale and outputs[name]:
+			writes[name] = pool.submit(exportJob, shape2brep(cap),
+				stl='./export/STL/' + name + '.stl' if exportSTL else None,
+				step='./export/STEP/' + name + '.step' if exportSTEP else None,
+				ply='./export/PLY/' + name + '.ply' if exportPLY else None,
+				tolerance=meshTol, angularTolerance=tolAng, adaptive=adaptive, keepMesh=keepMesh)
+	timings['build'] = perf_counter()-t
+	for name, w in writes.items():
+		times = w.result()
+		if keepMesh:
+			times, meshes[name] = times
+		for stage, dt in times.items():
+			timings[stage] += dt
+		manifest.update(name, specHashes[name], source, outputs[name])
+if exportIndividual:
+	manifest.save()
+keycaps = { name: keycaps[name] for name in todo }
+
+
+# build assembly
+t = perf_counter()
 assemblyTracking = {}
+placements = {}
 for i, name in enumerate(keycaps):
-	cap = keycaps[name]
-	# export individual
-	if exportIndividual:
-		if exportSTL:	exporters.export(cap, './export/STL/' + name + '.stl', tolerance=tol, angularTolerance=tolAng)
-		if exportSTEP:	exporters.export(cap, './export/STEP/' + name + '.step')
-	# build assembly
 	spec = name.split("_")
 	if spec[2] not in assemblyTracking: assemblyTracking[spec[2]] = { "x":0, "lastUnitX":0 }
 	unitX = float(spec[3].split("x")[0])/100
 	unitY = float(spec[3].split("x")[1])/100
 	posX = 19.05/2*(assemblyTracking[spec[2]]["lastUnitX"]+unitX) + assemblyTracking[spec[2]]["x"]
 	posY = 19.05/2*unitY + 19.05*(4-int(spec[2][1]))
-	assembly.add(cap, name=name, loc=cq.Location(cq.Vector(posX,posY,0)))
+	placements[name] = (posX, posY, 0)
 	assemblyTracking[spec[2]]["x"] = posX
 	assemblyTracking[spec[2]]["lastUnitX"] = unitX
+assembly = makeInstancedAssembly(keycaps, list(placements.items()))
+timings['assembly'] = perf_counter()-t
 
 # export assembly
 if exportAssembly:
-	if exportSTL:	exporters.export(assembly.toCompound(), './export/STL/'+prefix+'keycaps.stl', tolerance=tol, angularTolerance=tolAng)
-	if exportSTEP:	exporters.export(assembly.toCompound(), './export/STEP/'+prefix+'keycaps.step')
+	if exportSTL or exportPLY:
+		# mesh every cap in place, rather than meshing one big compound
+		t = perf_counter()
+		for name in placements:
+			if name not in meshes: meshes[name] = mesh.tessellate(keycaps[name], meshTol, tolAng, adaptive)
+		vertices, triangles = mesh.merge([meshes[name] for name in placements], list(placements.values()))
+		timings['mesh'] += perf_counter()-t
+	t = perf_counter()
+	if exportSTL:	mesh.writeSTL('./export/STL/'+prefix+'keycaps.stl', vertices, triangles)
+	timings['stl'] += perf_counter()-t
+	t = perf_counter()
+	if exportPLY:	mesh.writePLY('./export/PLY/'+prefix+'keycaps.ply', *mesh.weld(vertices, triangles))
+	timings['ply'] += perf_counter()-t
+	t = perf_counter()
+	if exportSTEP:	assembly.save('./export/STEP/'+prefix+'keycaps.step', 'STEP') # keeps each cap as one shared part
+	timings['step'] += perf_counter()-t
+
+# export plates
+if exportPlates and (exportSTL or exportPLY):
+	t = perf_counter()
+	packer = PlatePacker(plateSize, plateSpacing, plateTilt, supports=SupportPlanner(plateTilt, lift=plateLift) if plateSupports else None)
+	keys = { name: cache.getKey(generator, jobs[name]) for name in keycaps } if cache is not None else None
+	plates = packer.tessellate(keycaps, meshTol, tolAng, adaptive, meshes=meshes, keys=keys, workers=workers, cache=cache)
+	for i, (vertices, triangles) in enumerate(plates):
+		if exportSTL:	mesh.writeSTL('./export/STL/{0}plate{1}.stl'.format(prefix, i+1), vertices, triangles)
+		if exportPLY:	mesh.writePLY('./export/PLY/{0}plate{1}.ply'.format(prefix, i+1), *mesh.weld(vertices, triangles))
+	timings['plates'] = perf_counter()-t
+	print('{0} keys packed onto {1} plates'.format(len(keycaps), len(plates)))
+
+
+# summary; writer stages are summed across processes, so they can exceed the total
+print('{0} keys built, {1} written, {2} up to date, {3} stale files removed in {4:.2f}s'.format(
+	len(keycaps), len(stale), len(jobs)-len(stale) if exportIndividual else 0, len(removed), perf_counter()-start))
+for stage, dt in timings.items():
+	print('  {0:<10}{1:>8.2f}s'.format(stage, dt))
+if cache is not None:
+	print(cache.report())
 
 
 # show in cq-editor
@@ -5,4 +5,13 @@ import keycap.mount
 import keycap.stabilizer
 import keycap.print3d
 import keycap.vector
-import keycap.spec
\ No newline at end of file
+import keycap.spec
+import keycap.parallel
+import keycap.cache
+import keycap.manifest
+import keycap.trace
+import keycap.boolean
+import keycap.context
+import keycap.mesh
+import keycap.supports
+import keycap.plate
\ No newline at end of file
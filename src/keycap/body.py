@@ -1,15 +1,15 @@
 import cadquery as cq
+import numpy as np
 from cadquery import selectors as sel
-from keycap.helper import makeRoundRectWire, KeySizeSpec
-from keycap.vector import Vec2, Vec3
-from copy import deepcopy
+from keycap.helper import makeRoundRectWire, KeySizeSpec, FrozenSpec
+from keycap.vector import Vec2, Vec3, VecArray, getSinCos
 
 
 #TODO: make scoop more sensibly so that it always fully cuts the top of an equivalently specced core
 #      seems to run into issues with sufficiently large caps (2x2, 4x1, etc.)
 
 
-class KeyBody:
+class KeyBody(FrozenSpec):
 	
 	maxCurve = 50
 	maxAngle = 20
@@ -26,14 +26,13 @@ class KeyBody:
 		'ratio':	1.0,
 		'convex':	False,
 	}
+	fields = tuple(defaults.keys())
 	
 	# defaults to MX/OEM measurements
 	def __init__(self, **kwargs) -> 'KeyBody':
 		if 'curve' in kwargs:	kwargs['curve'] = max(-KeyBody.maxCurve, min(KeyBody.maxCurve, kwargs['curve']))
 		if 'angle' in kwargs:	kwargs['angle'] = max(-KeyBody.maxAngle, min(KeyBody.maxAngle, kwargs['angle']))
-		defaults = deepcopy(KeyBody.defaults)
-		for a in defaults.keys():
-			setattr(self, a, kwargs.get(a, defaults.get(a)))
+		self._set(**{ a: kwargs.get(a, KeyBody.defaults.get(a)) for a in KeyBody.fields })
 	
 	def makeCore(self, coreSize:Vec2=Vec2()) -> cq.Workplane:
 		dim2sk = lambda dim : cq.Sketch().rect(dim.x, dim.y).vertices().fillet(dim.z)
@@ -74,14 +73,25 @@ class KeyBody:
 		)
 		return scoop.sweep(scoop_path).translate((0, 0, -depthMid))
 
+	def getScoopSurface(self, coreSize:Vec2=Vec2(), origin:Vec3=None) -> 'ScoopSurface':
+		# origin defaults to where keycap() places the scoop
+		return ScoopSurface(self, coreSize, Vec3(0, -self.offset.y, self.height) if origin is None else origin)
+
 	def applyEdgeFinish(self, keycap, size:KeySizeSpec) -> cq.Workplane:
+		return self.applyEdgeFillet(keycap, size).cut(self.makeEdgeBotCut(size)) # manual bottom chamfer, auto one is bad
+
+	def applyEdgeFillet(self, keycap, size:KeySizeSpec) -> cq.Workplane:
+		sizeU = size.getFullSize()
+		return keycap.edges(sel.BoxSelector((sizeU.x/2,sizeU.y/2,self.edge.y),(-sizeU.x/2,-sizeU.y/2,self.height))).fillet(self.edge.x)
+
+	def makeEdgeBotCut(self, size:KeySizeSpec) -> cq.Workplane:
 		#TODO: derive path from keycap input and eliminate this crap
 		base = self.getBaseSize(size.getCoreSize())
 		sizeU = size.getFullSize()
 		edgeBotPath = makeRoundRectWire(base.x, base.y, base.z)
 		rimW = (sizeU.y-base.y)/2
 		rimH = rimW+self.edge.y
-		edgeBotCut = (
+		return (
 			cq.Workplane("YZ")
 			.moveTo(sizeU.y/2, 0)
 			.line(0, rimH)
@@ -89,11 +99,6 @@ class KeyBody:
 			.close()
 			.sweep(edgeBotPath)
 		)
-		return (
-			keycap
-			.edges(sel.BoxSelector((sizeU.x/2,sizeU.y/2,self.edge.y),(-sizeU.x/2,-sizeU.y/2,self.height))).fillet(self.edge.x)
-			.cut(edgeBotCut) # manual bottom chamfer, auto one is bad
-		)
 	
 	def getTopSize(self, coreSize:Vec2=Vec2()) -> Vec3:
 		return Vec3(self.top.x+coreSize.x, self.top.y+coreSize.y, self.corner.x)
@@ -113,20 +118,79 @@ class KeyBody:
 		return Vec3(bot.x, bot.y, self.height+top.z)
 	
 	def clone(self, **kwargs) -> 'KeyBody':
-		new = deepcopy(self)
-		for a in vars(new).keys():
-			if kwargs.get(a) is not None:
-				setattr(new, a, kwargs.get(a))
-		return new
-	
-	def __deepcopy__(self, memo=None) -> 'KeyBody':
-		if memo is None:	memo = {}
-		return KeyBody(**{a[0]:deepcopy(a[1],memo) for a in vars(self).items()})
+		return super().clone(**kwargs)
 	
 	def __str__(self) -> str:
 		return 'KeyBody({0})'.format(','.join(['{0}={1}'.format(a[0],a[1]) for a in vars(self).items()]))
 
 
+def getArc(t, half:float, h:float) -> tuple:
+	'''
+	Height, slope and second derivative at t of the circular arc through
+	(0,0) and (+-half,h), i.e. the threePointArc() segments in makeScoop().
+	Vectorized over t.
+	'''
+	t = np.asarray(t, dtype=float)
+	if h == 0:
+		return np.zeros_like(t), np.zeros_like(t), np.zeros_like(t)
+	sign = 1 if h > 0 else -1
+	r = (half*half+h*h)/(2*abs(h))
+	w = np.sqrt(np.maximum(r*r-t*t, 1e-12))
+	return sign*(r-w), sign*t/w, sign*r*r/(w*w*w)
+
+
+class ScoopSurface:
+	'''
+	Closed-form evaluator for the surface cut by KeyBody.makeScoop(), so points
+	and normals on the top of a keycap can be found without querying the solid.
+	The surface is parameterized by x along X and u along the tilted top (i.e.
+	along the sweep path, 0 at its center); both may be arrays.
+	
+	The profile arc is swept in its original (XZ) orientation and turned with
+	the path tangent, so the profile's "up" is world Z rotated by the path's
+	slope angle, which is not quite the top plane's normal.
+	'''
+
+	def __init__(self, body:KeyBody, coreSize:Vec2=Vec2(), origin:Vec3=Vec3()):
+		bot = body.getBaseSize(coreSize)
+		s, c = getSinCos(body.angle)
+		self.sin, self.cos = s, c
+		self.depthOut = body.depth*(-1 if body.convex else 1)
+		self.scoopX = bot.x/2*(1/body.ratio) if body.ratio<1 else bot.x/2
+		self.scoopY = bot.y/2 if body.ratio<1 else bot.y/2*body.ratio
+		self.origin = np.array((origin.x, origin.y, origin.z-(body.depth if body.convex else 0)))
+		self.e1 = np.array((0, c, s)) # path direction at center
+		self.e2 = np.array((0, -s, c))
+
+	def _evaluate(self, x, u) -> tuple:
+		x, u = np.broadcast_arrays(np.asarray(x, dtype=float).reshape(-1), np.asarray(u, dtype=float).reshape(-1))
+		p, dp, ddp = getArc(u, self.scoopY, self.depthOut)
+		q, dq, _ = getArc(x, self.scoopX, self.depthOut)
+		q = q-self.depthOut
+		k = 1/np.sqrt(1+dp*dp) # cos of path slope angle
+		z1 = self.sin*k - self.cos*dp*k # profile up, in (e1, e2)
+		z2 = self.sin*dp*k + self.cos*k
+		col = lambda v : v[:,None]
+		pts = self.origin + col(x)*(1,0,0) + col(u+q*z1)*self.e1 + col(p+q*z2)*self.e2
+		dphi = ddp*k*k
+		du = self.e1 + col(dp)*self.e2 + col(q*dphi)*(col(-z2)*self.e1 + col(z1)*self.e2)
+		dx = np.array((1.,0,0)) + col(dq)*(col(z1)*self.e1 + col(z2)*self.e2)
+		n = np.cross(dx, du)
+		return pts, n/np.linalg.norm(n, axis=1)[:,None]
+
+	def getPoints(self, x, u) -> VecArray:
+		return VecArray(self._evaluate(x, u)[0])
+
+	def getNormals(self, x, u) -> VecArray:
+		return VecArray(self._evaluate(x, u)[1])
+
+	def getPoint(self, x:float=0, u:float=0) -> Vec3:
+		return self.getPoints(x, u)[0]
+
+	def getNormal(self, x:float=0, u:float=0) -> Vec3:
+		return self.getNormals(x, u)[0]
+
+
 def makeCore(topW:float, topH:float, baseW:float, baseH:float, capH:float, curve:float=25, topA:float=9, topOff:float=0.85, topRad:float=1.5, baseRad:float=4):
 	curve = 1+(curve/100)
 	midX = (baseW-topW)/2*curve + topW
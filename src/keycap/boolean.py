@@ -0,0 +1,101 @@
+import cadquery as cq
+from concurrent.futures import ProcessPoolExecutor
+from keycap.parallel import shape2brep, brep2shape
+
+
+'''
+Batched booleans.
+
+Rather than chaining keycap - a - b + c + d, where every step re-intersects
+the growing solid, collect the tools in a BooleanBatch and apply them as one
+multi-argument OCC cut followed by one multi-argument fuse. Cuts always run
+before fuses, so e.g. a stem is never cut away by the mount negative it sits
+in. Set BATCHED to False to fall back to one boolean per tool, for comparison.
+
+fuseTree() is for fusing many small, mostly overlapping tools into each other,
+e.g. the bars of a support leg, and makeCompound() for skipping that entirely.
+'''
+
+
+BATCHED = True
+PARALLEL_PAIRS = 8 # fewest fuses in a level of fuseTree() worth sending to worker processes
+
+
+def getShapes(model) -> list:
+	if isinstance(model, cq.Workplane):
+		return [o for o in model.vals() if isinstance(o, cq.Shape)]
+	return [model]
+
+
+class BooleanBatch:
+
+	def __init__(self):
+		self.cuts = []
+		self.fuses = []
+
+	def cut(self, *tools) -> 'BooleanBatch':
+		for t in tools:
+			self.cuts += getShapes(t)
+		return self
+
+	def fuse(self, *tools) -> 'BooleanBatch':
+		for t in tools:
+			self.fuses += getShapes(t)
+		return self
+
+	def apply(self, model) -> cq.Workplane:
+		'''
+		Cut then fuse every collected tool into model, returning a new Workplane.
+		'''
+		shape = model.findSolid() if isinstance(model, cq.Workplane) else model
+		if BATCHED:
+			if self.cuts:	shape = shape.cut(*self.cuts).clean()
+			if self.fuses:	shape = shape.fuse(*self.fuses).clean()
+		else:
+			for t in self.cuts:		shape = shape.cut(t).clean()
+			for t in self.fuses:	shape = shape.fuse(t).clean()
+		return cq.CQ(shape)
+
+
+# TREE FUSING
+
+def fusePair(a:bytes, b:bytes) -> bytes:
+	# worker side of fuseTree(); shapes travel as BREP
+	return shape2brep(brep2shape(a).val().fuse(brep2shape(b).val()).clean())
+
+
+def fuseTree(shapes:list, workers:int=1, pool:ProcessPoolExecutor=None) -> cq.Shape:
+	'''
+	Fuse shapes by pairwise reduction, (a+b)+(c+d) rather than ((a+b)+c)+d, so
+	that no single boolean has to deal with the whole, growing result until the
+	last level. Given a pool, or workers>1 to start one for this call, levels
+	with at least PARALLEL_PAIRS fuses run in worker processes; smaller ones
+	aren't worth shipping as BREP, and run here. Pass a long-lived pool when
+	fusing often, as starting one costs more than a few small fuses.
+	'''
+	shapes = [s for m in shapes for s in getShapes(m)]
+	if not shapes:
+		raise ValueError('fuseTree() needs at least one shape')
+	parallel = pool is not None or (workers is not None and workers > 1)
+	if parallel and len(shapes)//2 >= PARALLEL_PAIRS:
+		owned = pool is None
+		if owned: pool = ProcessPoolExecutor(max_workers=min(workers, len(shapes)//2))
+		try:
+			data = [shape2brep(s) for s in shapes] # stays BREP until the levels get small
+			while len(data)//2 >= PARALLEL_PAIRS:
+				futures = [pool.submit(fusePair, data[i], data[i+1]) for i in range(0, len(data)-1, 2)]
+				data = [f.result() for f in futures] + ([data[-1]] if len(data)%2 else [])
+			shapes = [brep2shape(d).val() for d in data]
+		finally:
+			if owned: pool.shutdown()
+	while len(shapes) > 1:
+		shapes = [shapes[i].fuse(shapes[i+1]).clean() if i+1 < len(shapes) else shapes[i] for i in range(0, len(shapes), 2)]
+	return shapes[0]
+
+
+def makeCompound(shapes:list) -> cq.Compound:
+	'''
+	Gather shapes into one compound without fusing them; overlapping solids are
+	left as they are, which most slicers accept.
+	'''
+	return cq.Compound.makeCompound([s for m in shapes for s in getShapes(m)])
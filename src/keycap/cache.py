@@ -0,0 +1,368 @@
+import os
+import re
+import json
+import cadquery as cq
+import hashlib
+import inspect
+from enum import Enum
+from functools import lru_cache
+from collections import OrderedDict
+from os.path import dirname, abspath, join, getsize, getmtime
+from keycap.vector import Vec2, Vec3
+from keycap.helper import FrozenSpec
+from keycap.parallel import shape2brep, brep2shape
+
+
+'''
+Persistent, content-addressed BREP cache for built models.
+
+Entries are keyed by a canonical hash of the build arguments (e.g. the
+full KeySpec) plus a hash of the generator source, so editing either
+invalidates the affected entries automatically. Old entries are
+evicted least-recently-used first once the cache grows past maxBytes.
+
+ModelBank is the by-name counterpart, for parts that are looked up by a
+descriptive name rather than built from a spec (e.g. print3d.Leg3DP).
+'''
+
+
+# HASHING
+
+def canonical(obj):
+	'''
+	Reduce obj to a JSON-able structure that is identical for equal specs,
+	regardless of int/float spelling, dict order or object identity.
+	'''
+	if obj is None or isinstance(obj, (bool, str)):
+		return obj
+	if isinstance(obj, (int, float)):
+		return float(obj)
+	if isinstance(obj, FrozenSpec):
+		return canonical(obj.key())
+	if isinstance(obj, Enum):
+		return '{0}.{1}'.format(type(obj).__name__, obj.name)
+	if isinstance(obj, (Vec2, Vec3)):
+		return [canonical(v) for v in obj.toTuple()]
+	if isinstance(obj, dict):
+		return { str(k): canonical(v) for k, v in obj.items() }
+	if isinstance(obj, (list, tuple)):
+		return [canonical(v) for v in obj]
+	if hasattr(obj, '__dict__'):
+		return { '__type__': type(obj).__name__ } | { k: canonical(v) for k, v in vars(obj).items() }
+	raise TypeError('cannot canonicalize {0}'.format(type(obj).__name__))
+
+def getHash(obj) -> str:
+	data = json.dumps(canonical(obj), sort_keys=True, separators=(',', ':'))
+	return hashlib.sha256(data.encode()).hexdigest()
+
+@lru_cache(maxsize=None)
+def _hashFiles(files:tuple) -> str:
+	h = hashlib.sha256()
+	for p, _ in files:
+		with open(p, 'rb') as f:
+			h.update(f.read())
+	return h.hexdigest()
+
+def getSourceVersion(fn=None) -> str:
+	'''
+	Hash of the keycap package source, plus the file defining fn if given.
+	'''
+	pkg = dirname(abspath(__file__))
+	paths = sorted(join(pkg, f) for f in os.listdir(pkg) if f.endswith('.py'))
+	if fn is not None:
+		paths.append(abspath(inspect.getsourcefile(fn)))
+	return _hashFiles(tuple((p, getmtime(p)) for p in paths)) # mtime so edits in long sessions are picked up
+
+def getJobKey(fn, kwargs:dict, source:str=None) -> str:
+	# source pins the key to a getSourceVersion(fn) taken earlier, e.g. the code a worker pool runs
+	return getHash({
+		'fn':		'{0}.{1}'.format(fn.__module__, fn.__qualname__),
+		'args':		kwargs,
+		'source':	source if source is not None else getSourceVersion(fn),
+	})
+
+
+# CACHE
+
+class BrepCache:
+
+	def __init__(self, path:str, maxBytes:int=512*1024*1024):
+		self.path = path
+		self.maxBytes = maxBytes
+		self.hits = 0
+		self.misses = 0
+		self.stores = 0
+		self.evictions = 0
+		os.makedirs(path, exist_ok=True)
+		self.size = self.getSize() # running total, so puts only scan the directory when over maxBytes
+
+	def getKey(self, fn, kwargs:dict) -> str:
+		return getJobKey(fn, kwargs)
+
+	def getPath(self, key:str) -> str:
+		return join(self.path, key+'.brep')
+
+	def getBrep(self, key:str) -> bytes:
+		p = self.getPath(key)
+		try:
+			with open(p, 'rb') as f:
+				data = f.read()
+		except FileNotFoundError:
+			self.misses += 1
+			return None
+		os.utime(p) # mark as recently used
+		self.hits += 1
+		return data
+
+	def get(self, key:str):
+		data = self.getBrep(key)
+		if data is None:
+			return None
+		try:
+			return brep2shape(data)
+		except Exception: # truncated or corrupt entry, e.g. from an interrupted run
+			self.remove(key)
+			self.hits -= 1
+			self.misses += 1
+			return None
+
+	def remove(self, key:str):
+		p = self.getPath(key)
+		try:
+			size = getsize(p)
+			os.remove(p)
+		except FileNotFoundError:
+			return
+		self.size = max(0, self.size-size)
+
+	def putBrep(self, key:str, data:bytes):
+		p = self.getPath(key)
+		tmp = '{0}.{1}.tmp'.format(p, os.getpid())
+		with open(tmp, 'wb') as f:
+			f.write(data)
+		old = getsize(p) if os.path.exists(p) else 0
+		os.replace(tmp, p)
+		self.stores += 1
+		self.size += len(data)-old
+		if self.size > self.maxBytes:
+			self.evict()
+
+	def put(self, key:str, model):
+		self.putBrep(key, shape2brep(model))
+		return model
+
+	def evict(self):
+		entries = [join(self.path, f) for f in os.listdir(self.path) if f.endswith('.brep')]
+		entries = sorted(((getmtime(p), getsize(p), p) for p in entries), reverse=True)
+		total, kept = 0, 0
+		for _, size, p in entries:
+			total += size
+			if total > self.maxBytes:
+				os.remove(p)
+				self.evictions += 1
+			else:
+				kept = total
+		self.size = kept
+
+	def getSize(self) -> int:
+		return sum(getsize(join(self.path, f)) for f in os.listdir(self.path) if f.endswith('.brep'))
+
+	def report(self) -> str:
+		total = self.hits+self.misses
+		return 'BrepCache({0}): {1} hits, {2} misses ({3:.0%} hit rate), {4} stored, {5} evicted, {6:.1f}MB'.format(
+			self.path, self.hits, self.misses, self.hits/total if total else 0, self.stores, self.evictions, self.getSize()/1024/1024)
+
+
+class ModelBank:
+	'''
+	Store of models by name. Keeps up to maxsize models in memory, dropping the
+	least recently used; if path is given, every model is also written there as
+	BREP, so later runs can load it instead of building it again. Disk entries
+	belong to a version (e.g. a hash of the code and settings that built them);
+	opening the bank with a different one deletes them. On disk the bank is kept
+	under maxBytes, dropping the least recently used files first.
+
+	Files live in a modelbank subdirectory of path, so path can be shared, e.g.
+	with a BrepCache. The index is an append-only log (index.jsonl) in there:
+	every store adds one line, and it is compacted when the bank is opened. Only
+	files the index recorded, and the bank's own temporary files, are deleted.
+	'''
+
+	DIR = 'modelbank'
+	TMP = re.compile(r'([0-9a-f]{32}\.brep|index\.jsonl)\.\d+\.tmp') # see put() and saveIndex()
+
+	def __init__(self, maxsize:int=256, path:str=None, version:str='', maxBytes:int=256*1024*1024):
+		self.maxsize = maxsize
+		self.path = path
+		self.version = version
+		self.maxBytes = maxBytes
+		self.models = OrderedDict()
+		self.index = {} # name -> { 'file', 'workplane', 'size' }
+		self.size = 0
+		self.hits = 0
+		self.diskHits = 0
+		self.misses = 0
+		self.stores = 0
+		self.evictions = 0
+		if path is not None:
+			os.makedirs(self._getPath(), exist_ok=True)
+			self._open()
+
+	def _getPath(self, file:str='') -> str:
+		return join(self.path, ModelBank.DIR, file)
+
+	def _getIndexPath(self) -> str:
+		return self._getPath('index.jsonl')
+
+	def _open(self):
+		recorded = set() # every file the index names, in any version
+		try:
+			with open(self._getIndexPath()) as f:
+				current = json.loads(f.readline() or '{}').get('version') == self.version
+				for line in f:
+					try:
+						e = json.loads(line)
+					except json.JSONDecodeError: # torn last line from an interrupted run
+						break
+					if e.get('removed'):
+						self.index.pop(e['name'], None)
+						continue
+					recorded.add(e['file'])
+					if current:
+						self.index[e.pop('name')] = e
+		except (FileNotFoundError, json.JSONDecodeError):
+			pass
+		# recorded files no longer in the index belong to another version, or were replaced
+		known = { e['file'] for e in self.index.values() }
+		for f in os.listdir(self._getPath()):
+			if (f in recorded and f not in known) or ModelBank.TMP.fullmatch(f):
+				os.remove(self._getPath(f))
+		for name, e in list(self.index.items()):
+			if not os.path.exists(self._getPath(e['file'])):
+				del self.index[name]
+		self.size = sum(e['size'] for e in self.index.values())
+		self.saveIndex()
+		if self.size > self.maxBytes:
+			self.evict()
+
+	def _append(self, entry:dict):
+		with open(self._getIndexPath(), 'a') as f:
+			f.write(json.dumps(entry, sort_keys=True)+'\n')
+
+	def _remember(self, name:str, model):
+		self.models[name] = model
+		self.models.move_to_end(name)
+		if len(self.models) > self.maxsize:
+			self.models.popitem(last=False)
+
+	def _load(self, name:str):
+		e = self.index.get(name)
+		if e is None:
+			return None
+		p = self._getPath(e['file'])
+		try:
+			with open(p, 'rb') as f:
+				model = brep2shape(f.read())
+		except Exception: # missing, truncated or corrupt
+			self.remove(name)
+			return None
+		os.utime(p) # mark as recently used, for evict()
+		return model if e['workplane'] else model.val()
+
+	def get(self, name:str):
+		if name in self.models:
+			self.models.move_to_end(name)
+			self.hits += 1
+			return self.models[name]
+		model = self._load(name) if self.path is not None else None
+		if model is None:
+			self.misses += 1
+			return None
+		self.diskHits += 1
+		self._remember(name, model)
+		return model
+
+	def put(self, name:str, model):
+		self._remember(name, model)
+		self.stores += 1
+		if self.path is not None:
+			file = hashlib.sha256(name.encode()).hexdigest()[:32]+'.brep'
+			p = self._getPath(file)
+			data = shape2brep(model)
+			tmp = '{0}.{1}.tmp'.format(p, os.getpid())
+			with open(tmp, 'wb') as f:
+				f.write(data)
+			os.replace(tmp, p)
+			self.size += len(data) - self.index.get(name, {}).get('size', 0)
+			self.index[name] = { 'file':file, 'workplane':isinstance(model, cq.Workplane), 'size':len(data) }
+			self._append({ 'name':name } | self.index[name])
+			if self.size > self.maxBytes:
+				self.evict()
+		return model
+
+	def remove(self, name:str):
+		e = self.index.pop(name, None)
+		if e is None:
+			return
+		try:
+			os.remove(self._getPath(e['file']))
+		except FileNotFoundError:
+			pass
+		self.size -= e['size']
+		self._append({ 'name':name, 'removed':True })
+
+	def evict(self):
+		'''
+		Delete the least recently used files until the bank is under maxBytes.
+		'''
+		def lastUsed(name):
+			try:
+				return getmtime(self._getPath(self.index[name]['file']))
+			except FileNotFoundError:
+				return 0
+		for name in sorted(self.index, key=lastUsed):
+			if self.size <= self.maxBytes:
+				break
+			self.remove(name)
+			self.evictions += 1
+
+	def saveIndex(self):
+		'''
+		Rewrite the index with only its live entries.
+		'''
+		p = self._getIndexPath()
+		tmp = '{0}.{1}.tmp'.format(p, os.getpid())
+		with open(tmp, 'w') as f:
+			f.write(json.dumps({ 'version':self.version })+'\n')
+			for name, e in sorted(self.index.items()):
+				f.write(json.dumps({ 'name':name } | e, sort_keys=True)+'\n')
+		os.replace(tmp, p)
+
+	def clear(self):
+		'''
+		Forget every model in memory; files on disk are kept.
+		'''
+		self.models.clear()
+
+	def __contains__(self, name:str) -> bool:
+		return name in self.models or name in self.index
+
+	def __len__(self) -> int:
+		return len(self.models)
+
+	def report(self) -> str:
+		total = self.hits+self.diskHits+self.misses
+		return 'ModelBank({0}): {1} hits, {2} from disk, {3} misses ({4:.0%} hit rate), {5} stored, {6}/{7} in memory, {8} evicted, {9:.1f}MB'.format(
+			self.path or 'memory', self.hits, self.diskHits, self.misses, (self.hits+self.diskHits)/total if total else 0, self.stores, len(self.models), self.maxsize,
+			self.evictions, self.size/1024/1024)
+
+
+def build(fn, cache:BrepCache=None, **kwargs):
+	'''
+	Return fn(**kwargs), loading it from cache when possible.
+	'''
+	if cache is None:
+		return fn(**kwargs)
+	key = cache.getKey(fn, kwargs)
+	model = cache.get(key)
+	return model if model is not None else cache.put(key, fn(**kwargs))
@@ -0,0 +1,58 @@
+import cadquery as cq
+from cadquery import selectors as sel
+from functools import cached_property
+from keycap.spec import KeySpec
+from keycap.helper import makeOffsetSolid
+from keycap import mount
+
+
+'''
+Per-key build context.
+
+Several stages of a keycap build need the same expensive primitives, e.g.
+the mount negative is both cut from the cap and used by makeTopNegative()
+to shape the hollow. A BuildContext builds each of them on first use and
+hands the same model to every stage after that.
+'''
+
+
+class BuildContext:
+
+	def __init__(self, spec:KeySpec=KeySpec(), thickness:float=1.2):
+		self.spec = spec
+		self.thickness = thickness # top wall thickness, for makeTopNegative()
+
+	@cached_property
+	def core(self) -> cq.Workplane:
+		return self.spec.body.makeCore(self.spec.size.getCoreSize())
+
+	@cached_property
+	def scoop(self) -> cq.Workplane:
+		# extra height only reaches further above the cap, so the same scoop
+		# also serves as the (translated) inner scoop of the hollow
+		body = self.spec.body
+		return body.makeScoop(self.spec.size.getCoreSize(), extraHeight=self.thickness*2).translate((0, -body.offset.y, body.height))
+
+	@cached_property
+	def innerScoop(self) -> cq.Workplane:
+		return self.scoop.translate((0, self.spec.body.offset.y, -self.thickness))
+
+	@cached_property
+	def outer(self) -> cq.Workplane:
+		# the scooped core, before edge finishing
+		return self.core - self.scoop
+
+	@cached_property
+	def innerOffset(self) -> cq.Workplane:
+		# outer, shrunk by the wall thickness on every side
+		return makeOffsetSolid(self.outer, -self.thickness)
+
+	@cached_property
+	def mountNeg(self) -> cq.Workplane:
+		return mount.makeCherryNeg(self.spec.size) if self.spec.mount.mxMount else mount.makeChocNeg(self.spec.size)
+
+	@cached_property
+	def mountNegWire(self) -> cq.Wire:
+		# outline of the top of the mount negative
+		skirtH = mount.getSkirtHeight(self.spec.mount.mxMount, False)
+		return cq.Wire.assembleEdges(self.mountNeg.faces(sel.NearestToPointSelector((0, 0, skirtH))).val().Edges())
@@ -1,9 +1,15 @@
 import cadquery as cq
 from enum import Enum
-from copy import deepcopy
+from collections import OrderedDict
+from functools import wraps
 import math
+import json
+import hashlib
 import numpy as np
-from keycap.vector import Vec2, Vec3
+from OCP.BRepOffsetAPI import BRepOffsetAPI_MakeOffsetShape
+from OCP.BRepOffset import BRepOffset_Skin
+from OCP.GeomAbs import GeomAbs_Intersection
+from keycap.vector import Vec2, Vec3, VecArray
 
 
 #NOTE: possible bug in get3DPTiltedHeight
@@ -12,6 +18,68 @@ from keycap.vector import Vec2, Vec3
 # FUNCTIONS
 
 
+def copyModel(model):
+	# located copies share the underlying geometry, so this is cheap but
+	# still keeps a cached original safe from whatever the caller does next
+	if isinstance(model, cq.Workplane):
+		return model.newObject([o.located(o.location()) if isinstance(o, cq.Shape) else o for o in model.objects])
+	return model.located(model.location()) if isinstance(model, cq.Shape) else model
+
+
+def makeInstancedAssembly(parts:dict, placements:list, name:str=None) -> cq.Assembly:
+	'''
+	Return an Assembly with parts (label -> model) placed at every (label,
+	(x, y, z)) in placements. Every placement of a label refers to the same
+	model object, which Assembly.save() writes to STEP once and instances,
+	rather than toCompound() writing a copy per placement.
+	'''
+	assembly = cq.Assembly(name=name)
+	counts = {}
+	for label, pos in placements:
+		counts[label] = counts.get(label, 0)+1
+		assembly.add(parts[label], name=label if counts[label] == 1 else '{0}_{1}'.format(label, counts[label]), loc=cq.Location(cq.Vector(*pos)))
+	return assembly
+
+
+MEMOIZED = [] # every function wrapped by memoizeModel()
+
+def clearModelCaches():
+	for fn in MEMOIZED:
+		fn.cacheClear()
+
+
+def memoizeModel(key=None, maxsize:int=32):
+	'''
+	Decorator for functions that build a model purely from their arguments.
+	Results are kept in an LRU of maxsize entries, keyed by key(*args, **kwargs)
+	or by the raw arguments if they are hashable, and callers always receive
+	a located copy. The wrapped function gains cacheInfo() and cacheClear().
+	'''
+	def decorator(fn):
+		models = OrderedDict()
+		stats = { 'hits':0, 'misses':0 }
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			k = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+			if k in models:
+				models.move_to_end(k)
+				stats['hits'] += 1
+			else:
+				stats['misses'] += 1
+				models[k] = fn(*args, **kwargs)
+				if len(models) > maxsize:
+					models.popitem(last=False)
+			return copyModel(models[k])
+		def cacheClear():
+			models.clear()
+			stats.update(hits=0, misses=0)
+		wrapper.cacheInfo = lambda : stats | { 'size':len(models), 'maxsize':maxsize }
+		wrapper.cacheClear = cacheClear
+		MEMOIZED.append(wrapper)
+		return wrapper
+	return decorator
+
+
 def makeRoundRectWire(w=10, h=10, rad=1, plane="XY"):
 	rect = cq.CQ(plane).rect(w, h)
 	cnr = rect.vertices().vals()
@@ -43,7 +111,17 @@ def makeRoundDraftedBlock(x=2, y=2, height=2, fillet=1, draft=1.5):
 	return makeDraftedWire(x/2, height, draft).sweep(path) + cq.CQ(cq.Solid.makeLoft([path, path.translate((0,0,height))], True))
 
 
+def makeOffsetSolid(model, offset:float, tolerance:float=1e-4) -> cq.Workplane:
+	# solid bounded by every face of model moved along its normal by offset (negative = inwards)
+	shape = model.findSolid() if isinstance(model, cq.Workplane) else model
+	builder = BRepOffsetAPI_MakeOffsetShape()
+	builder.PerformByJoin(shape.wrapped, offset, tolerance, BRepOffset_Skin, False, False, GeomAbs_Intersection)
+	result = cq.Shape.cast(builder.Shape())
+	return cq.CQ(result if isinstance(result, cq.Solid) else cq.Solid.makeSolid(result.Shells()[0]))
+
+
 def apply3DPTilt(vec:Vec3, tilt:float=35, tiltY:float=None) -> Vec3:
+	# works in-place on either a Vec3 or a whole VecArray
 	tiltY = tiltY if isinstance(tiltY,(int,float)) else tilt
 	return vec.rotateZ(-tilt).rotateY(tiltY).rotateZ(tilt)
 
@@ -51,61 +129,151 @@ def apply3DPTilt(vec:Vec3, tilt:float=35, tiltY:float=None) -> Vec3:
 def get3DPTiltedHeight(aabb:Vec3, angle:float=35, angleY:float=None):
 	size = aabb*Vec3(0.5,-0.5,1)
 	roof_h = size.z/math.sin(math.radians(90-(angleY if isinstance(angleY,(int,float)) else angle))) #might run into issues w/ different angle+angleY???
-	FRB = apply3DPTilt(size*Vec3(1,1,0), angle, angleY)
-	BLT = apply3DPTilt(size*Vec3(-1,-1,1), angle, angleY)
+	FRB, BLT = apply3DPTilt(VecArray([size*Vec3(1,1,0), size*Vec3(-1,-1,1)]), angle, angleY)
 	return { 'top':BLT.z, 'roof':FRB.z+roof_h, 'bot':FRB.z, 'h_roof':roof_h, 'h_top':BLT.z-FRB.z, 'ratio':roof_h/aabb.z }
 
 
-class KeySizeSpec:
+# SPECS
+
+
+def _rebuild(cls, values:tuple):
+	new = object.__new__(cls)
+	for a, v in zip(cls.fields, values):
+		object.__setattr__(new, a, v)
+	return new
+
+
+class FrozenSpec:
+	'''
+	Base for immutable, hashable spec types. Subclasses list their attributes
+	in fields; clone() shares every field it doesn't replace instead of copying,
+	so vectors held by a spec must be treated as values and never modified
+	in place.
+	'''
+
+	__slots__ = ('_key',) # keeps the memoized key out of vars()
+	fields:tuple = ()
+
+	def _set(self, **kwargs):
+		for a in self.fields:
+			object.__setattr__(self, a, kwargs.get(a))
+
+	def __setattr__(self, name, value):
+		raise AttributeError('{0} is immutable; use clone()'.format(type(self).__name__))
+
+	def __delattr__(self, name):
+		raise AttributeError('{0} is immutable; use clone()'.format(type(self).__name__))
+
+	def clone(self, **kwargs):
+		return type(self)(**{ a: getattr(self, a) if kwargs.get(a) is None else kwargs.get(a) for a in self.fields })
+
+	def key(self) -> tuple:
+		'''
+		Canonical nested tuple of this spec's values; equal specs have equal keys
+		regardless of int/float spelling.
+		'''
+		try:
+			return self._key
+		except AttributeError:
+			object.__setattr__(self, '_key', (type(self).__name__,) + tuple(FrozenSpec._keyOf(getattr(self, a)) for a in self.fields))
+			return self._key
+
+	@staticmethod
+	def _keyOf(v):
+		if isinstance(v, FrozenSpec):		return v.key()
+		if isinstance(v, (Vec2, Vec3)):		return tuple(float(c) for c in v.toTuple())
+		if isinstance(v, Enum):				return '{0}.{1}'.format(type(v).__name__, v.name)
+		if isinstance(v, bool) or v is None:	return v
+		if isinstance(v, (int, float)):		return float(v)
+		return v
+
+	def getHash(self) -> str:
+		'''
+		Stable (cross-process, cross-run) sha256 of this spec.
+		'''
+		return hashlib.sha256(json.dumps(self.key(), separators=(',', ':')).encode()).hexdigest()
+
+	def toDict(self) -> dict:
+		'''
+		Compact, JSON-able form of this spec; see fromDict().
+		'''
+		d = {}
+		for a in self.fields:
+			v = getattr(self, a)
+			d[a] = v.toDict() if isinstance(v, FrozenSpec) else list(v.toTuple()) if isinstance(v, (Vec2, Vec3)) else v.name if isinstance(v, Enum) else v
+		return d
+
+	@classmethod
+	def fromDict(cls, d:dict):
+		'''
+		Rebuild a spec from toDict() output; missing fields take their defaults,
+		which also decide how each value is interpreted.
+		'''
+		default = cls()
+		kwargs = {}
+		for a in cls.fields:
+			v, dv = d.get(a), getattr(default, a)
+			if v is None:						kwargs[a] = dv
+			elif isinstance(dv, FrozenSpec):	kwargs[a] = type(dv).fromDict(v)
+			elif isinstance(dv, (Vec2, Vec3)):	kwargs[a] = type(dv)(*v)
+			elif isinstance(dv, Enum):			kwargs[a] = type(dv)[v]
+			else:								kwargs[a] = v
+		return cls(**kwargs)
+
+	def __eq__(self, o) -> bool:
+		return type(o) is type(self) and o.key() == self.key()
+
+	def __hash__(self) -> int:
+		return hash(self.key())
+
+	def __reduce__(self):
+		return (_rebuild, (type(self), tuple(getattr(self, a) for a in self.fields)))
+
+	def __copy__(self):
+		return self
+
+	def __deepcopy__(self, memo=None):
+		return self
+
+
+
+class KeySizeSpec(FrozenSpec):
 	# defaults to 1U MX spacing
-	
+
+	fields = ('units', 'spacing')
+
 	def __init__(self, units:Vec2=Vec2(1,1), spacing:Vec2=Vec2(19.05,19.05)):
-		self.units:Vec2 =	units
-		self.spacing:Vec2 =	spacing
-	
-	def clone(self, units=None, spacing=None):
-		args = locals()
-		new = deepcopy(self)
-		for a in args.keys()^['self']:
-			if args.get(a) is not None:
-				setattr(new, a, args.get(a))
-		return new
-	
-	def __deepcopy__(self, memo=None):
-		if memo is None:
-			memo = {}
-		return KeySizeSpec(deepcopy(self.units,memo), deepcopy(self.spacing,memo))
-	
+		self._set(units=units, spacing=spacing)
+
+	def clone(self, units=None, spacing=None) -> 'KeySizeSpec':
+		return super().clone(units=units, spacing=spacing)
+
 	def __str__(self):
 		return "KeySizeSpec(units={0},spacing={1})".format(self.units, self.spacing)
-	
+
 	def getCoreSize(self):
 		return Vec2(max(0,self.units.x-1)*self.spacing.x, max(0,self.units.y-1)*self.spacing.y)
-	
+
 	def getFullSize(self):
 		return Vec2(self.units.x*self.spacing.x, self.units.y*self.spacing.y)
 
 
 
-class KeyMountSpec:
-	
+class KeyMountSpec(FrozenSpec):
+
+	fields = ('mxMount', 'mxStem', 'stab', 'stabIsPOS')
+
 	def __init__(self, mxMount:bool=True, mxStem:bool=True, stab:bool=True, stabIsPOS:bool=False):
-		self.mxMount: bool =	mxMount		# false = kailh choc v1
-		self.mxStem: bool =		mxStem		# false = kailh choc v1
-		self.stab: bool =		stab
-		self.stabIsPOS: bool =	stabIsPOS	# use POS style stabilizers
-	
-	def clone(self, mxMount=None, mxStem=None, stab=None, stabIsPOS=None):
-		args = locals()
-		new = deepcopy(self)
-		for a in args.keys()^['self']:
-			if args.get(a) is not None:
-				setattr(new, a, args.get(a))
-		return new
-	
-	def __deepcopy__(self, memo=None):
-		return KeyMountSpec(deepcopy(self.mxMount), deepcopy(self.mxStem), deepcopy(self.stab), deepcopy(self.stabIsPOS))
-	
+		self._set(
+			mxMount=mxMount,		# false = kailh choc v1
+			mxStem=mxStem,			# false = kailh choc v1
+			stab=stab,
+			stabIsPOS=stabIsPOS,	# use POS style stabilizers
+		)
+
+	def clone(self, mxMount=None, mxStem=None, stab=None, stabIsPOS=None) -> 'KeyMountSpec':
+		return super().clone(mxMount=mxMount, mxStem=mxStem, stab=stab, stabIsPOS=stabIsPOS)
+
 	def __str__(self):
 		return "KeyMountSpec(mxMount={0},mxStem={1},stab={2},stabIsPOS={3})".format(self.mxMount, self.mxStem, self.stab, self.stabIsPOS)
 
@@ -125,29 +293,23 @@ class KeyMarkShape(Enum):
 
 
 
-class KeyMarkSpec:
-	
+class KeyMarkSpec(FrozenSpec):
+
+	fields = ('shape', 'count', 'size', 'depth', 'offset', 'rotation')
+
 	def __init__(self, shape=KeyMarkShape.NONE, count=2, size=2, depth=0.5, offset=Vec2(), rotation=Vec2()):
-		self.shape: KeyMarkShape =	shape
-		self.count: int =		max(1, count)		# dots count, polygon edges
-		self.size: float =		size		# radius for dot ring, windows/dish, solid ring; spacing for hexarray
-		self.depth: float =		depth		# thickness for lines, radius for spheres, height for windows/dish
-		self.offset: Vec2 =		offset		# multiplier for keytop size
-		self.rotation: Vec2 =	rotation	# in degrees
-	
-	def clone(self, shape=None, count=None, size=None, depth=None, offset=None, rotation=None):
-		args = locals()
-		new = deepcopy(self)
-		for a in args.keys()^['self']:
-			if args.get(a) is not None:
-				setattr(new, a, args.get(a))
-		return new
-	
-	def __deepcopy__(self, memo=None):
-		if memo is None:
-			memo = {}
-		return KeyMarkSpec(deepcopy(self.shape), deepcopy(self.count), deepcopy(self.size), deepcopy(self.depth), deepcopy(self.offset,memo), deepcopy(self.rotation,memo))
-	
+		self._set(
+			shape=shape,
+			count=max(1, count),	# dots count, polygon edges
+			size=size,				# radius for dot ring, windows/dish, solid ring; spacing for hexarray
+			depth=depth,			# thickness for lines, radius for spheres, height for windows/dish
+			offset=offset,			# multiplier for keytop size
+			rotation=rotation,		# in degrees
+		)
+
+	def clone(self, shape=None, count=None, size=None, depth=None, offset=None, rotation=None) -> 'KeyMarkSpec':
+		return super().clone(shape=shape, count=count, size=size, depth=depth, offset=offset, rotation=rotation)
+
 	def __str__(self):
 		return "KeyMarkSpec(shape={0},count={1},size={2},depth={3},offset={4},rotation={5})".format(
 			self.shape, self.count, self.size, self.depth, self.offset, self.rotation)
\ No newline at end of file
@@ -3,6 +3,7 @@ import math
 import cadquery as cq
 import cq_warehouse.extensions
 from keycap.spec import KeySpec
+from keycap.trace import stage
 
 # TODO
 # - solid circle
@@ -10,7 +11,7 @@ from keycap.spec import KeySpec
 # - fujitsu tombstone keycap homing mark (on FM Towns FMT-KB205; see https://youtu.be/pFvnROFlgCc?t=93)
 # - other shapes?
 # - fix addDots() centering issue (DONE???)
-# - figure out how to get cap top face center without contrived bs
+# - figure out how to get cap top face center without contrived bs (DONE for addDots1/addInsetBulb, see body.ScoopSurface)
 
 
 	# HOMING/WIN-KEY FEATURES
@@ -65,11 +66,15 @@ def addWinBulb(keycap, topH:float=19.05, topOff:float=0.85, topAng:float=9, conv
 	)
 	return keycap.cut(cut) + bulb
 
-def addInsetBulb(keycap, spec:KeySpec=KeySpec()):
+def makeInsetBulb(spec:KeySpec=KeySpec()) -> tuple:
+	'''
+	Return the (cut, bulb) tools for addInsetBulb(), placed on the keycap top.
+	'''
 	# need to incorporate more of the spec settings instead of using hardcoded stuff
-	Hdir = ang2dir(spec.body.angle)
-	pt = getCapCenter(keycap, spec.body.height, spec.body.offset.y).toTuple()[0]
-	ptProj = highestIntersection(keycap, pt, Hdir)
+	surface = spec.body.getScoopSurface(spec.size.getCoreSize())
+	ptProj = surface.getPoint().toTuple()
+	n = surface.getNormal()
+	tilt = math.degrees(math.atan2(-n.y, n.z))
 	rad = 5
 	insetH = 1.25 if spec.body.convex else 0.15
 	insetA = 37.5
@@ -83,7 +88,7 @@ def addInsetBulb(keycap, spec:KeySpec=KeySpec()):
 		.hLineTo(0)
 		.close()
 		.sweep(path)
-		.rotate((0,0,0),(1,0,0),spec.body.angle)
+		.rotate((0,0,0),(1,0,0),tilt)
 		.translate(ptProj)
 	)
 	bulb = (
@@ -93,9 +98,13 @@ def addInsetBulb(keycap, spec:KeySpec=KeySpec()):
 		.hLineTo(0)
 		.close()
 		.sweep(path)
-		.rotate((0,0,0),(1,0,0),spec.body.angle)
+		.rotate((0,0,0),(1,0,0),tilt)
 		.translate(ptProj)
 	)
+	return cut, bulb
+
+def addInsetBulb(keycap, spec:KeySpec=KeySpec()):
+	cut, bulb = makeInsetBulb(spec)
 	return keycap.cut(cut) + bulb
 
 
@@ -118,26 +127,35 @@ def addDots(keycap, count:float=2, radius:float=0.5, ringRadius:float=1.8, topH:
 		)
 	return keycap
 
-def addDots1(keycap, spec:KeySpec=KeySpec()):
-	# need to incorporate more of the spec settings instead of using hardcoded stuff, i think?
+def getDotPositions(spec:KeySpec=KeySpec()) -> tuple:
+	'''
+	Return the (x, u) coordinates on the keycap top (see body.ScoopSurface) of
+	every homing dot in spec, as two lists.
+	'''
 	topSize = spec.body.getTopSize(spec.size.getCoreSize())
-	Hdir = ang2dir(spec.body.angle)
-	pt = cq.Vector(getCapCenter(keycap, spec.body.height, spec.body.offset.y, cq.Vector(topSize.x*spec.mark.offset.x,topSize.y*spec.mark.offset.y,0)).toTuple()[0])
+	cx, cu = topSize.x*spec.mark.offset.x, topSize.y*spec.mark.offset.y
+	if spec.mark.count == 1:
+		return [cx], [cu]
 	Hstart = ((spec.mark.count%2+1)%2)*360/spec.mark.count/2+90 # make the first dot not start at the top, but only if even number of dots
-	H_points = [cq.Vector()] if spec.mark.count==1 else [cq.Vector(p.toTuple()[0]) for p in (
-		cq.Workplane("XY")
-		.transformed(rotate=cq.Vector(spec.body.angle, 0, 0))
-		.polarArray(spec.mark.size, Hstart, 360, spec.mark.count)
-		.vals()
-	)]
-	for p in H_points:
-		point = highestIntersection(keycap, p.add(pt), Hdir)
-		keycap += (
-			cq.Workplane("XY")
-			.transformed(offset=point)
-			.sphere(spec.mark.depth)
-		)
-	return keycap
+	angles = [math.radians(Hstart+i*360/spec.mark.count) for i in range(spec.mark.count)]
+	return [cx+spec.mark.size*math.cos(a) for a in angles], [cu+spec.mark.size*math.sin(a) for a in angles]
+
+def makeDots1(spec:KeySpec=KeySpec()) -> cq.Workplane:
+	'''
+	Return the homing dots for addDots1() as one Workplane of spheres.
+	'''
+	with stage('homing.surface'):
+		points = spec.body.getScoopSurface(spec.size.getCoreSize()).getPoints(*getDotPositions(spec))
+	sphere = cq.Solid.makeSphere(spec.mark.depth, angleDegrees1=-90)
+	return cq.Workplane("XY").newObject([sphere.translate(cq.Vector(*p.toTuple())) for p in points])
+
+def addDots1(keycap, spec:KeySpec=KeySpec()):
+	# need to incorporate more of the spec settings instead of using hardcoded stuff, i think?
+	with stage('homing.addDots1', keycap) as span:
+		for dot in makeDots1(spec).vals():
+			with stage('homing.fuse', keycap) as s:
+				keycap = s.out(keycap + dot)
+		return span.out(keycap)
 
 
 #TODO: solid circle home mark, idk how to sweep the foking projected wire tho
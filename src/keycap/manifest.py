@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+
+
+'''
+Export manifest for incremental exports.
+
+Records, for every exported label, the hash of its build inputs, the
+hash of the generator source and the hash of each output file, so a
+rerun only has to rebuild and rewrite labels whose inputs changed or
+whose outputs were modified or removed.
+'''
+
+
+def getFileHash(path:str) -> str:
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda : f.read(1024*1024), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class ExportManifest:
+
+	version = 1
+
+	def __init__(self, path:str):
+		self.path = path
+		self.entries = {}
+		try:
+			with open(path) as f:
+				data = json.load(f)
+			if data.get('version') == ExportManifest.version:
+				self.entries = data.get('entries', {})
+		except (FileNotFoundError, json.JSONDecodeError):
+			pass
+
+	def isCurrent(self, label:str, specHash:str, sourceHash:str, files:list[str]) -> bool:
+		'''
+		Whether label was last exported from the same inputs to exactly these
+		files, and none of them have changed on disk since.
+		'''
+		e = self.entries.get(label)
+		if e is None or e['spec'] != specHash or e['source'] != sourceHash or set(e['files']) != set(files):
+			return False
+		return all(os.path.isfile(p) and getFileHash(p) == h for p, h in e['files'].items())
+
+	def update(self, label:str, specHash:str, sourceHash:str, files:list[str]):
+		self.entries[label] = {
+			'spec':		specHash,
+			'source':	sourceHash,
+			'files':	{ p: getFileHash(p) for p in files },
+		}
+
+	def prune(self, labels) -> list[str]:
+		'''
+		Forget labels that are no longer exported and delete their outputs.
+		Returns the deleted file paths.
+		'''
+		removed = []
+		for label in set(self.entries)-set(labels):
+			for p in self.entries.pop(label)['files']:
+				if os.path.isfile(p):
+					os.remove(p)
+					removed.append(p)
+		return removed
+
+	def save(self):
+		os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+		tmp = self.path+'.tmp'
+		with open(tmp, 'w') as f:
+			json.dump({ 'version':ExportManifest.version, 'entries':self.entries }, f, indent='\t', sort_keys=True)
+		os.replace(tmp, self.path)
@@ -0,0 +1,167 @@
+import numpy as np
+import cadquery as cq
+from OCP.BRep import BRep_Tool
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.BRepTools import BRepTools
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopAbs import TopAbs_REVERSED
+
+
+'''
+Mesh export without going through OCC's writers.
+
+tessellate() meshes a model once and returns it as a (vertices, triangles)
+pair of ndarrays; writeSTL() and writePLY() pack those into their binary
+formats and write each file in a single call. Meshes from tessellate() keep
+every face's vertices separate, weld() merges the coincident ones, which
+indexed formats like PLY benefit from and STL ignores.
+
+With adaptive=True, tolerance is an absolute chord error bound instead of
+one relative to each edge's size, so every face is refined only as far as
+its curvature needs: gently curved faces like the scoop get fine steps,
+while flat walls and tight stem fillets stay coarse. The whole shape is
+meshed in one pass, so faces sharing an edge share its discretization and
+the mesh stays closed; getOpenEdges() checks that.
+'''
+
+
+STL_DTYPE = np.dtype([
+	('normal',		'<f4', (3,)),
+	('vertices',	'<f4', (3,3)),
+	('attr',		'<u2'),
+])
+
+PLY_FACE_DTYPE = np.dtype([
+	('count',		'u1'),
+	('vertices',	'<i4', (3,)),
+])
+
+
+# TESSELLATION
+
+def getShape(model) -> cq.Shape:
+	if not isinstance(model, cq.Workplane):
+		return model
+	shapes = [o for o in model.vals() if isinstance(o, cq.Shape)]
+	return shapes[0] if len(shapes) == 1 else cq.Compound.makeCompound(shapes)
+
+
+def tessellate(model, tolerance:float=0.001, angularTolerance:float=0.1, adaptive:bool=False) -> tuple:
+	'''
+	Mesh a Workplane or Shape, returning float (N,3) vertices and int (M,3)
+	triangles, wound counter-clockwise seen from outside. If adaptive, tolerance
+	is the chord error bound (mm) on every face, rather than relative to edge
+	size; angularTolerance is the coarsest angular step any face may get.
+	'''
+	shape = getShape(model)
+	if adaptive:
+		BRepTools.Clean_s(shape.wrapped) # so a relative mesh from earlier isn't kept
+	BRepMesh_IncrementalMesh(shape.wrapped, tolerance, not adaptive, angularTolerance, True)
+	vertices, triangles, offset = [], [], 0
+	for face in shape.Faces():
+		loc = TopLoc_Location()
+		poly = BRep_Tool.Triangulation_s(face.wrapped, loc)
+		if poly is None:
+			continue
+		nodes = [poly.Node(i) for i in range(1, poly.NbNodes()+1)]
+		v = np.array([(p.X(), p.Y(), p.Z()) for p in nodes])
+		t = np.array([poly.Triangle(i).Get() for i in range(1, poly.NbTriangles()+1)], dtype=np.int64)-1
+		if not loc.IsIdentity():
+			trsf = loc.Transformation()
+			m = np.array([[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)])
+			v = v @ m[:,:3].T + m[:,3]
+		if face.wrapped.Orientation() == TopAbs_REVERSED:
+			t = t[:,::-1]
+		vertices.append(v)
+		triangles.append(t+offset)
+		offset += len(v)
+	if not vertices:
+		return np.zeros((0,3)), np.zeros((0,3), dtype=np.int64)
+	return np.concatenate(vertices), np.concatenate(triangles)
+
+
+def merge(meshes:list, offsets:list=None) -> tuple:
+	'''
+	Combine (vertices, triangles) meshes into one, optionally translating
+	each by the matching (x, y, z) in offsets.
+	'''
+	vertices, triangles, n = [], [], 0
+	for i, (v, t) in enumerate(meshes):
+		vertices.append(v + offsets[i] if offsets is not None else v)
+		triangles.append(t+n)
+		n += len(v)
+	return np.concatenate(vertices), np.concatenate(triangles)
+
+
+def weld(vertices:np.ndarray, triangles:np.ndarray, tolerance:float=1e-6) -> tuple:
+	'''
+	Merge vertices closer than about tolerance and drop the triangles that
+	collapse as a result.
+	'''
+	keys = np.round(vertices/tolerance).astype(np.int64)
+	_, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+	t = inverse.reshape(-1)[triangles]
+	t = t[(t[:,0] != t[:,1]) & (t[:,1] != t[:,2]) & (t[:,2] != t[:,0])]
+	return vertices[first], t
+
+
+def getOpenEdges(triangles:np.ndarray) -> np.ndarray:
+	'''
+	Return the (E,2) edges of a welded mesh that aren't shared by exactly two
+	triangles; empty for a closed, manifold mesh.
+	'''
+	edges = np.sort(triangles[:,[0,1,1,2,2,0]].reshape(-1,2), axis=1)
+	unique, counts = np.unique(edges, axis=0, return_counts=True)
+	return unique[counts != 2]
+
+
+def getNormals(vertices:np.ndarray, triangles:np.ndarray) -> np.ndarray:
+	v = vertices[triangles]
+	n = np.cross(v[:,1]-v[:,0], v[:,2]-v[:,0])
+	mag = np.linalg.norm(n, axis=1)[:,None]
+	return np.divide(n, mag, out=np.zeros_like(n), where=mag>0)
+
+
+# WRITING
+
+def toSTL(vertices:np.ndarray, triangles:np.ndarray, header:bytes=b'keycap') -> bytes:
+	data = np.zeros(len(triangles), dtype=STL_DTYPE)
+	data['normal'] = getNormals(vertices, triangles)
+	data['vertices'] = vertices[triangles]
+	return header[:80].ljust(80, b'\0') + np.uint32(len(data)).tobytes() + data.tobytes()
+
+
+def writeSTL(path:str, vertices:np.ndarray, triangles:np.ndarray):
+	with open(path, 'wb') as f:
+		f.write(toSTL(vertices, triangles))
+
+
+def toPLY(vertices:np.ndarray, triangles:np.ndarray) -> bytes:
+	header = '\n'.join([
+		'ply',
+		'format binary_little_endian 1.0',
+		'element vertex {0}'.format(len(vertices)),
+		'property float x',
+		'property float y',
+		'property float z',
+		'element face {0}'.format(len(triangles)),
+		'property list uchar int vertex_indices',
+		'end_header',
+	])+'\n'
+	faces = np.zeros(len(triangles), dtype=PLY_FACE_DTYPE)
+	faces['count'] = 3
+	faces['vertices'] = triangles
+	return header.encode('ascii') + vertices.astype('<f4').tobytes() + faces.tobytes()
+
+
+def writePLY(path:str, vertices:np.ndarray, triangles:np.ndarray):
+	with open(path, 'wb') as f:
+		f.write(toPLY(vertices, triangles))
+
+
+def exportSTL(model, path:str, tolerance:float=0.001, angularTolerance:float=0.1, adaptive:bool=False):
+	writeSTL(path, *tessellate(model, tolerance, angularTolerance, adaptive))
+
+
+def exportPLY(model, path:str, tolerance:float=0.001, angularTolerance:float=0.1, adaptive:bool=False):
+	writePLY(path, *weld(*tessellate(model, tolerance, angularTolerance, adaptive)))
@@ -3,8 +3,9 @@ import cadquery as cq
 import math
 from keycap.spec import KeySpec
 from keycap.vector import Vec2, Vec3
-from keycap.helper import KeySizeSpec, makeDraftedCylinder, makeDraftedBlock, makeRoundRectWire, makeRoundDraftedBlock
-from keycap import body
+from keycap.helper import KeySizeSpec, makeDraftedCylinder, makeDraftedBlock, makeRoundRectWire, makeRoundDraftedBlock, memoizeModel
+from keycap import body, context
+from keycap.trace import stage
 
 
 # TODO
@@ -31,6 +32,7 @@ def getChocGap(unit:float=2):
 
 # CHERRY MX
 
+@memoizeModel()
 def makeCherryStem(thin:float=1.17, long:float=4.10, h:float=3.8, d:float=5.5, padding:float=0.1, tolerance:float=0.06, isBox:bool=False): 
 	extentW = thin+tolerance*2
 	extentL = long+tolerance*2
@@ -60,6 +62,7 @@ def makeCherryStem(thin:float=1.17, long:float=4.10, h:float=3.8, d:float=5.5, p
 	))
 	return MXstem
 
+@memoizeModel()
 def makeCherrySupport(height:float=10, d=5.5, long=4.10, margin:float=0.2, draft:float=1.5, isBox:bool=False):
 	core = makeDraftedCylinder(d/2+margin, height, draft)
 	if isBox: core = core.intersect(makeDraftedBlock(d+margin*2, long+margin*2, height, draft))
@@ -69,6 +72,7 @@ def getCherrySize(sizeSpec=KeySizeSpec(), clearance=0.0):
 	# z = fillet
 	return Vec3(15.4+clearance,15.4+clearance,1.75) + sizeSpec.getCoreSize()
 
+@memoizeModel()
 def makeCherryNegative(uX:float, unitX:float, uY:float, unitY:float, padding:float=0.1):
 	#TODO: non-preplate skirt
 	# based on official cherry mx docs;
@@ -94,6 +98,7 @@ def makeCherryNegative(uX:float, unitX:float, uY:float, unitY:float, padding:flo
 	solid = cq.Solid.extrudeLinear(cq.Face.makeFromWires(path), cq.Vector(0,0,padding+5+1.2))
 	return (cq.CQ(solid)-shape).translate((0,0,-padding))
 
+@memoizeModel()
 def makeCherryNegative1(keySize=KeySizeSpec(), padding:float=0.1):
 	#TODO: non-preplate skirt
 	# based on official cherry mx docs;
@@ -126,6 +131,7 @@ def getCherrySkirtHeight(preplate:bool=False):
 
 # KAILH CHOCOLATE V1
 
+@memoizeModel()
 def makeChocStem(thin:float=1.2, long:float=3.0, gap:float=5.7, h:float=3.8, padding:float=0.1, tolerance:float=0.035):
 	extentX = thin/2-tolerance
 	extentY = long/2-tolerance
@@ -146,6 +152,7 @@ def makeChocStem(thin:float=1.2, long:float=3.0, gap:float=5.7, h:float=3.8, pad
 	)
 	return CHstem.translate((gap/2, 0, padding)) + CHstem.translate((-gap/2, 0, padding))
 
+@memoizeModel()
 def makeChocSupport(height=10, margin=1.2, fillet=1, draft=1.5):
 	size = Vec2(5.7+1.2+margin*2, 3.0+margin*2)
 	return makeRoundDraftedBlock(size.x, size.y, height, fillet, draft)
@@ -154,6 +161,7 @@ def getChocSize(sizeSpec=KeySizeSpec(), clearance=0.7):
 	# z = fillet
 	return Vec3(15.2+clearance,15.2+clearance,2.0) + sizeSpec.getCoreSize()
 
+@memoizeModel()
 def makeChocNegative(uX:float, unitX:float, uY:float, unitY:float, padding:float=0.1):
 	# kailh choc v1
 	# (non-pre) plate skirt length
@@ -178,6 +186,7 @@ def makeChocNegative(uX:float, unitX:float, uY:float, unitY:float, padding:float
 	solid = cq.Solid.extrudeLinear(cq.Face.makeFromWires(path), cq.Vector(0,0,padding+2.5+0.8))
 	return (cq.CQ(solid)-shape).translate((0,0,-padding))
 
+@memoizeModel()
 def makeChocNegative1(keySize=KeySizeSpec(), padding:float=0.1):
 	# return makeChocNegative(keySize.spacing.x, keySize.units.x, keySize.spacing.y, keySize.units.y, padding)
 	# kailh choc v1
@@ -251,37 +260,52 @@ def makePOSStems1(stem, size:KeySizeSpec=KeySizeSpec()):
 
 # TOP CUTOUT
 
-def makeTopNegative(spec=KeySpec(), thickness:float=1.2):
+def makeTopNegative(spec=KeySpec(), thickness:float=1.2, ctx:'context.BuildContext'=None, method:str='loft'):
+	'''
+	Hollow out the cap above the mount, leaving a top wall of the given thickness.
+	method 'loft' builds a shrunken core and scoop for the inside, 'offset' offsets
+	the outer body inwards, which keeps the wall thickness constant along the
+	normals but can fail on degenerate bodies.
+	'''
 	ks:KeySpec = spec
+	ctx = ctx if ctx is not None and ctx.thickness == thickness else context.BuildContext(spec, thickness)
 	skirtH = getSkirtHeight(ks.mount.mxMount, False)
 	sizeU = ks.size.getFullSize()
 
-	negative = makeCherryNeg(ks.size) if ks.mount.mxMount else makeChocNeg(ks.size)
-	neg_face = negative.faces(sel.NearestToPointSelector((0, 0, skirtH)))
-	neg_wire = cq.Wire.assembleEdges(neg_face.val().Edges())
-	neg_extrude = cq.CQ(cq.Solid.makeLoft([neg_wire.translate((0,0,-0.1)), neg_wire.translate((0,0,ks.body.height))], True))
-
-	ks_inner = ks.clone()
-	ks_inner.body.base -= Vec2(x=thickness*2, y=thickness*2)
-	ks_inner.body.top -= Vec2(thickness*2, thickness*2)
-	ks_inner.body.corner = Vec2(max(0.01,ks_inner.body.corner.x-thickness), max(0.01,ks_inner.body.corner.y-thickness))
-	coretest = ks_inner.body.makeCore(ks_inner.size.getCoreSize())
-	scooptest = ks.body.makeScoop(ks_inner.size.getCoreSize(), extraHeight=thickness*2).translate((0, 0, ks.body.height-thickness))
-
-	base = neg_extrude.intersect(coretest-scooptest)
-
-	mxSupport = makeCherrySupport(height=ks.body.height, margin=thickness/6, isBox=True, long=4.1 if spec.mount.mxMount else 4.0)
-	support = makeCherrySupport(height=ks.body.height, margin=thickness/6, isBox=True) if ks.mount.mxMount else makeChocSupport(height=ks.body.height)
-	xSupport = makeDraftedBlock(sizeU.x, thickness, ks.body.height)
-	ySupport = makeDraftedBlock(thickness, sizeU.y, ks.body.height)
-	gapX = getCherryGap(spec.size.units.x) if spec.mount.mxMount else getChocGap(spec.size.units.x)
-	gapY = getCherryGap(spec.size.units.y) if spec.mount.mxMount else getChocGap(spec.size.units.y)
-	stabX = (mxSupport+ySupport).translate((gapX,0,0))+(mxSupport+ySupport).translate((-gapX,0,0))
-	stabY = (mxSupport+xSupport).translate((0,gapY,0))+(mxSupport+xSupport).translate((0,-gapY,0))
-	stabSupport = cq.CQ("XY").add(stabX+stabY if gapX and gapY else stabX if gapX else stabY)
-	support += xSupport + ySupport + stabSupport
-
-
-	return base - support.translate((0,0,skirtH)).edges("<Z").chamfer(thickness/6)
+	with stage('mount.makeTopNegative') as span:
+		with stage('topneg.negative'):
+			neg_wire = ctx.mountNegWire
+			neg_extrude = cq.CQ(cq.Solid.makeLoft([neg_wire.translate((0,0,-0.1)), neg_wire.translate((0,0,ks.body.height))], True))
+
+		with stage('topneg.inner') as s:
+			if method == 'offset':
+				inner = ctx.innerOffset
+			elif method == 'loft':
+				ks_inner = ks.clone(body=ks.body.clone(
+					base=ks.body.base-Vec2(thickness*2, thickness*2),
+					top=ks.body.top-Vec2(thickness*2, thickness*2),
+					corner=Vec2(max(0.01,ks.body.corner.x-thickness), max(0.01,ks.body.corner.y-thickness)),
+				))
+				inner = ks_inner.body.makeCore(ks_inner.size.getCoreSize()) - ctx.innerScoop
+			else:
+				raise ValueError('unknown hollowing method {0!r}'.format(method))
+
+			base = s.out(neg_extrude.intersect(inner))
+
+		with stage('topneg.supports') as s:
+			mxSupport = makeCherrySupport(height=ks.body.height, margin=thickness/6, isBox=True, long=4.1 if spec.mount.mxMount else 4.0)
+			support = makeCherrySupport(height=ks.body.height, margin=thickness/6, isBox=True) if ks.mount.mxMount else makeChocSupport(height=ks.body.height)
+			xSupport = makeDraftedBlock(sizeU.x, thickness, ks.body.height)
+			ySupport = makeDraftedBlock(thickness, sizeU.y, ks.body.height)
+			gapX = getCherryGap(spec.size.units.x) if spec.mount.mxMount else getChocGap(spec.size.units.x)
+			gapY = getCherryGap(spec.size.units.y) if spec.mount.mxMount else getChocGap(spec.size.units.y)
+			stabX = (mxSupport+ySupport).translate((gapX,0,0))+(mxSupport+ySupport).translate((-gapX,0,0))
+			stabY = (mxSupport+xSupport).translate((0,gapY,0))+(mxSupport+xSupport).translate((0,-gapY,0))
+			stabSupport = cq.CQ("XY").add(stabX+stabY if gapX and gapY else stabX if gapX else stabY)
+			support += xSupport + ySupport + stabSupport
+			s.out(support)
+
+		with stage('topneg.cut'):
+			return span.out(base - support.translate((0,0,skirtH)).edges("<Z").chamfer(thickness/6))
 
 makeTopNeg = makeTopNegative
\ No newline at end of file
@@ -0,0 +1,129 @@
+import warnings
+import cadquery as cq
+from cadquery import exporters
+from io import BytesIO
+from time import perf_counter
+from keycap import trace, mesh
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+'''
+Batch building of independent models, optionally fanned out to a
+process pool. Worker results are shipped back as serialized BREP,
+since OCC shapes cannot be pickled directly.
+'''
+
+
+# SERIALIZATION
+
+def shape2brep(model) -> bytes:
+	shape = model.val() if isinstance(model, cq.Workplane) else model
+	buf = BytesIO()
+	shape.exportBrep(buf)
+	return buf.getvalue()
+
+def brep2shape(data:bytes) -> cq.Workplane:
+	return cq.CQ(cq.Shape.importBrep(BytesIO(data)))
+
+
+# BUILDING
+
+def buildJob(fn, kwargs:dict, label:str=None, traced:bool=False) -> tuple:
+	'''
+	Run a single build in a worker process and return the result as BREP,
+	along with its trace spans (as dicts) if traced.
+	'''
+	trace.reset() # forked workers inherit the parent's recorders
+	if not traced:
+		return shape2brep(fn(**kwargs)), []
+	tracer = trace.Tracer()
+	with trace.recording(tracer):
+		model = tracedBuild(fn, kwargs, label)
+	return shape2brep(model), [span.toDict() for span in tracer.spans]
+
+def tracedBuild(fn, kwargs:dict, label:str=None):
+	with trace.stage(label or fn.__qualname__) as s:
+		return s.out(fn(**kwargs))
+
+def buildIter(fn, jobs:dict, workers:int=1, cache=None):
+	'''
+	Build every label in jobs (label -> kwargs for fn), yielding (label, model)
+	as each one becomes available; cache hits first, then builds in completion
+	order. With workers>1 the builds run in a process pool; fn must then be
+	importable from a worker, i.e. a module-level function. If a BrepCache is
+	given, cached labels are loaded instead of built, and new builds are stored.
+	While a trace recorder is active, every build is wrapped in a span named
+	after its label, including builds run in worker processes.
+	'''
+	todo, keys = {}, {}
+	for label, kwargs in jobs.items():
+		if cache is not None:
+			keys[label] = cache.getKey(fn, kwargs)
+			model = cache.get(keys[label])
+			if model is not None:
+				yield label, model
+				continue
+		todo[label] = kwargs
+
+	if workers is None or workers <= 1 or len(todo) <= 1:
+		for label, kwargs in todo.items():
+			model = tracedBuild(fn, kwargs, label)
+			if cache is not None: cache.put(keys[label], model)
+			yield label, model
+	else:
+		with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+			traced = trace.isRecording()
+			futures = { pool.submit(buildJob, fn, kwargs, label, traced): label for label, kwargs in todo.items() }
+			for f in as_completed(futures):
+				label, (data, spans) = futures[f], f.result()
+				for span in spans:
+					trace.emit(trace.Span.fromDict(span))
+				if cache is not None: cache.putBrep(keys[label], data)
+				yield label, brep2shape(data)
+
+def buildMany(fn, jobs:dict, workers:int=1, cache=None) -> dict:
+	'''
+	Same as buildIter(), but returns a dict of label -> model in the same
+	order as jobs.
+	'''
+	results = dict(buildIter(fn, jobs, workers, cache))
+	return { label: results[label] for label in jobs }
+
+
+# EXPORTING
+
+def exportJob(data:bytes, stl:str=None, step:str=None, tolerance:float=0.001, angularTolerance:float=0.1, ply:str=None, adaptive:bool=False, keepMesh:bool=False):
+	'''
+	Write a BREP-serialized model to STL, PLY and/or STEP, returning the time
+	spent (s) on each stage so callers can aggregate them. The model is only
+	tessellated once for both mesh formats, with a warning if it isn't
+	closed; with keepMesh, that (vertices, triangles) mesh is returned too,
+	as (times, mesh).
+	'''
+	times = {}
+	t = perf_counter()
+	model = brep2shape(data)
+	times['load'] = perf_counter()-t
+	if stl or ply:
+		t = perf_counter()
+		vertices, triangles = mesh.tessellate(model, tolerance, angularTolerance, adaptive)
+		welded = mesh.weld(vertices, triangles)
+		times['mesh'] = perf_counter()-t
+		gaps = len(mesh.getOpenEdges(welded[1]))
+		if gaps:
+			warnings.warn('{0} has {1} open or non-manifold edges'.format(stl or ply, gaps))
+	if stl:
+		t = perf_counter()
+		mesh.writeSTL(stl, vertices, triangles)
+		times['stl'] = perf_counter()-t
+	if ply:
+		t = perf_counter()
+		mesh.writePLY(ply, *welded)
+		times['ply'] = perf_counter()-t
+	if step:
+		t = perf_counter()
+		exporters.export(model, step)
+		times['step'] = perf_counter()-t
+	if keepMesh:
+		return times, (vertices, triangles) if stl or ply else None
+	return times
@@ -0,0 +1,147 @@
+from keycap import mesh
+from keycap.helper import apply3DPTilt
+from keycap.vector import Vec2, Vec3, VecArray
+
+
+'''
+Build-plate nesting for printing whole sets.
+
+Every cap is printed tilted as in helper.apply3DPTilt(), so its footprint
+on the plate is the XY extent of its tilted mesh rather than its keyboard
+size. PlatePacker packs those footprints onto as few plates as it
+can with shelf packing: caps are sorted by depth, each one goes on the
+first shelf of the first plate with room left for it, and a new shelf or
+plate is only opened when nothing has room. Placed caps are meshed, tilted
+and moved on the mesh itself, so each plate comes out as one combined mesh
+without any extra booleans.
+
+By default caps sit straight on the plate and supports are left to the
+slicer. Given a supports.SupportPlanner, the packer instead runs it on
+every cap first (see SupportPlanner.generateIter()) and packs the supported
+models as they come out of it, already tilted and standing on their legs, so
+footprints include the feet.
+'''
+
+
+class Plate:
+
+	def __init__(self, size:Vec2):
+		self.size = size
+		self.shelves = [] # [y, depth, used width]
+		self.items = {} # name -> position of the footprint's min corner
+
+	def __len__(self) -> int:
+		return len(self.items)
+
+	def place(self, name:str, footprint:Vec2, spacing:float) -> bool:
+		'''
+		Place a footprint on this plate if there is room; returns whether it
+		was placed.
+		'''
+		for shelf in self.shelves:
+			if footprint.y <= shelf[1] and shelf[2]+2*spacing+footprint.x <= self.size.x:
+				self.items[name] = Vec2(shelf[2]+spacing, shelf[0])
+				shelf[2] += spacing+footprint.x
+				return True
+		y = self.shelves[-1][0]+self.shelves[-1][1]+spacing if self.shelves else spacing
+		if y+footprint.y+spacing > self.size.y or 2*spacing+footprint.x > self.size.x:
+			return False
+		self.shelves.append([y, footprint.y, spacing+footprint.x])
+		self.items[name] = Vec2(spacing, y)
+		return True
+
+
+class PlatePacker:
+
+	def __init__(self,
+		size:Vec2=Vec2(143, 89),	# usable XY area of the build plate
+		spacing:float=2.0,			# between caps, and between caps and the plate edge
+		tilt:float=35,				# see helper.apply3DPTilt()
+		tiltY:float=None,
+		lift:float=0.0,				# lowest point of a cap above the plate; leave at 0 when the slicer adds supports
+		height:float=None,			# usable Z height, if caps should be checked against it
+		supports=None,				# SupportPlanner to support every cap with; replaces tilt and lift
+	):
+		self.size = size
+		self.spacing = spacing
+		self.tilt = tilt
+		self.tiltY = tiltY
+		self.lift = lift
+		self.height = height
+		self.supports = supports
+
+	def getTilted(self, points:VecArray) -> VecArray:
+		if self.supports is not None:
+			return points # already oriented by the planner
+		return apply3DPTilt(points, self.tilt, self.tiltY)
+
+	def getLift(self) -> float:
+		return 0.0 if self.supports is not None else self.lift
+
+	def prepare(self, models:dict, keys:dict=None, workers:int=1, cache=None) -> dict:
+		'''
+		Return models as they will be printed, i.e. with supports added if
+		the packer has a planner; keys, workers and cache are passed on to
+		SupportPlanner.generateIter().
+		'''
+		if self.supports is None:
+			return models
+		results = dict(self.supports.generateIter(models, keys, workers, cache))
+		return { name: results[name] for name in models }
+
+	def getFootprint(self, points:VecArray) -> tuple:
+		'''
+		Return the min corner and size of tilted points, e.g. mesh vertices.
+		'''
+		lo, hi = points.getMin(), points.getMax()
+		return lo, hi-lo
+
+	def pack(self, footprints:dict) -> list[Plate]:
+		'''
+		Pack footprints (name -> Vec2 size) onto plates, biggest first. Raises
+		ValueError for a footprint that doesn't fit on an empty plate.
+		'''
+		plates = []
+		for name, fp in sorted(footprints.items(), key=lambda f : (-f[1].y, -f[1].x)):
+			if not any(p.place(name, fp, self.spacing) for p in plates):
+				plates.append(Plate(self.size))
+				if not plates[-1].place(name, fp, self.spacing):
+					raise ValueError("'{0}' ({1:.1f}x{2:.1f}mm tilted) does not fit on a {3:.1f}x{4:.1f}mm plate".format(name, fp.x, fp.y, self.size.x, self.size.y))
+		return plates
+
+	def layout(self, points:dict) -> tuple:
+		'''
+		Pack models onto plates, given the tilted points of each (name ->
+		VecArray). Returns the plates, and per model the offset that moves its
+		tilted points into place.
+		'''
+		lift = self.getLift()
+		footprints, offsets = {}, {}
+		for name, p in points.items():
+			lo, size = self.getFootprint(p)
+			if self.height is not None and size.z+lift > self.height:
+				raise ValueError("'{0}' is {1:.1f}mm tall tilted, over the {2:.1f}mm plate height".format(name, size.z+lift, self.height))
+			footprints[name] = size.toVec2()
+			offsets[name] = lo
+		plates = self.pack(footprints)
+		for p in plates:
+			for name, pos in p.items.items():
+				offsets[name] = pos.toVec3() + Vec3(z=lift) - offsets[name]
+		return plates, offsets
+
+	def tessellate(self, models:dict, tolerance:float=0.001, angularTolerance:float=0.1, adaptive:bool=False, meshes:dict=None, keys:dict=None, workers:int=1, cache=None) -> list[tuple]:
+		'''
+		Return one combined (vertices, triangles) mesh per plate. Meshes already
+		made for some models can be passed in to skip meshing those again; they
+		are ignored with supports, which change the model. keys, workers and
+		cache are for supports, see prepare().
+		'''
+		models = self.prepare(models, keys, workers, cache)
+		meshes = meshes if meshes and self.supports is None else {}
+		meshes = { name: meshes.get(name) or mesh.tessellate(model, tolerance, angularTolerance, adaptive) for name, model in models.items() }
+		tilted = { name: self.getTilted(VecArray(v)) for name, (v, _) in meshes.items() }
+		plates, offsets = self.layout(tilted)
+		out = []
+		for p in plates:
+			out.append(mesh.merge([(tilted[name].translate(offsets[name]).toArray(), meshes[name][1]) for name in p.items]))
+		return out
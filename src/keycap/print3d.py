@@ -2,10 +2,14 @@
 import cadquery as cq
 # import keycap as kc
 # from keycap.helper import *
+import os
 import math
 # import numpy
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
 from keycap.vector import Vec2, Vec3
+from keycap.cache import ModelBank, getHash, getSourceVersion
+from keycap.boolean import fuseTree, makeCompound, getShapes
 
 
 #NOTE: CHITUBOX LIGHT SUPPORT MEASUREMENTS
@@ -21,7 +25,7 @@ from keycap.vector import Vec2, Vec3
 
 class Leg3DP:
 
-	bank = {}
+	bank = ModelBank() # see openBank()
 	s_angle = 50
 	s_barangle = 22.5
 	s_bargap = 0.5
@@ -31,6 +35,9 @@ class Leg3DP:
 	s_bardia = 0.40
 	s_tiplen = 1.0
 	s_both = 0.5
+	s_fuse = 'tree'	# how shins and feet are joined, see combine()
+	workers = 1		# processes used by tree fusing
+	pool = None		# (pid, workers, executor) kept between combine() calls, see getPool()
 	
 	def __init__(self, h=32, w=5, pos:Vec3=Vec3(), angle=0, tip=1.5):
 		self.h = h
@@ -105,14 +112,47 @@ class Leg3DP:
 		dif = pos2-self.pos.clone()
 		return self.clone(w=dif.mag(), angle=dif.ang())
 
+	@classmethod
+	def getSettings(cls) -> dict:
+		return { k: v for k, v in vars(Leg3DP).items() if k.startswith('s_') }
+
+	@classmethod
+	def openBank(cls, path:str=None, maxsize:int=256, maxBytes:int=256*1024*1024) -> ModelBank:
+		'''
+		Replace the model bank, e.g. with one persisted to path so legs are only
+		built once across runs. Persisted legs are deleted when the keycap code or
+		any s_ setting changes; they're kept in their own subdirectory of path.
+		'''
+		Leg3DP.bank = ModelBank(maxsize, path, getHash({ 'source':getSourceVersion(), 'settings':Leg3DP.getSettings() }), maxBytes)
+		return Leg3DP.bank
+
+	@classmethod
+	def getPool(cls) -> ProcessPoolExecutor:
+		'''
+		Return the process pool tree fusing uses, started on first use and kept
+		until workers changes or closePool(); None with workers<=1.
+		'''
+		if Leg3DP.workers is None or Leg3DP.workers <= 1:
+			return None
+		pid, workers, pool = Leg3DP.pool or (None, None, None)
+		if pid != os.getpid() or workers != Leg3DP.workers: # forked children can't use the parent's pool
+			if pid == os.getpid(): pool.shutdown()
+			Leg3DP.pool = (os.getpid(), Leg3DP.workers, ProcessPoolExecutor(max_workers=Leg3DP.workers))
+		return Leg3DP.pool[2]
+
+	@classmethod
+	def closePool(cls):
+		if Leg3DP.pool is not None and Leg3DP.pool[0] == os.getpid():
+			Leg3DP.pool[2].shutdown()
+		Leg3DP.pool = None
+
 	@classmethod
 	def getManagedModel(cls, name):
-		return Leg3DP.bank[name] if name in Leg3DP.bank else None
+		return Leg3DP.bank.get(name)
 	
 	@classmethod
 	def addManagedModel(cls, name, model):
-		Leg3DP.bank[name] = model
-		return model
+		return Leg3DP.bank.put(name, model)
 	
 	def generateKnee(self):
 		'''
@@ -169,13 +209,33 @@ class Leg3DP:
 		model = a.toCompound().fuse()
 		return Leg3DP.addManagedModel(modelname, model)
 	
+	@classmethod
+	def combine(cls, shapes:list):
+		'''
+		Join placed leg parts according to s_fuse: 'tree' fuses them pairwise (see
+		boolean.fuseTree()), 'single' in one boolean over all of them, and 'none'
+		just gathers them into a compound of overlapping solids.
+		'''
+		if Leg3DP.s_fuse == 'tree':
+			return fuseTree(shapes, pool=Leg3DP.getPool())
+		if Leg3DP.s_fuse == 'single':
+			return makeCompound(shapes).fuse()
+		if Leg3DP.s_fuse == 'none':
+			return makeCompound(shapes)
+		raise ValueError("unknown fuse mode '{0}'".format(Leg3DP.s_fuse))
+
+	@classmethod
+	def place(cls, model, pos:tuple) -> list:
+		# placed copies share their geometry with model
+		return [s.moved(cq.Location(cq.Vector(pos))) for s in getShapes(model)]
+	
 	@classmethod
 	def generateShin(cls, h:float, bars:list[Vec2]=[]):
 		'''
 		Return a CQ model of a shin of a given height, with attached nets toward an arbitrary
 		number of XY points. 
 		'''
-		a = cq.Assembly()
+		parts = []
 		barName = lambda b : 'BAR{0}A{1}M'.format(b.ang(), b.mag())
 
 		names = ['SHIN_{0}H'.format(h)]
@@ -183,7 +243,8 @@ class Leg3DP:
 			name = barName(bars[i])
 			if name not in names:
 				names.append(name)
-		model = Leg3DP.getManagedModel('_'.join(names))
+		fullname = '_'.join(names) + ('_C' if Leg3DP.s_fuse == 'none' else '')
+		model = Leg3DP.getManagedModel(fullname)
 		if model is not None:
 			return model
 		
@@ -199,13 +260,13 @@ class Leg3DP:
 					.cylinder(Leg3DP.getBarLen(b.mag()),Leg3DP.s_bardia/2)
 				).rotate((0,0,0),(0,0,1),b.ang()) )
 			for j in range(1+int(h//(bar_h+Leg3DP.s_bargap))):
-				a.add(bar, name='bar_{0}_{1}'.format(i,j), loc=cq.Location(cq.Vector(0,0,-(bar_h+Leg3DP.s_bargap)*j)))
+				parts += Leg3DP.place(bar, (0,0,-(bar_h+Leg3DP.s_bargap)*j))
 		modelname = names[0]
 		shin = Leg3DP.getManagedModel(modelname)
 		if shin is None:
 			shin = Leg3DP.addManagedModel(modelname, cq.CQ().transformed(offset=(0,0,-h/2)).cylinder(h,Leg3DP.s_middia/2))
-		a.add(shin, name='shin')
-		return Leg3DP.addManagedModel('_'.join(names), a.toCompound().fuse())
+		parts += getShapes(shin)
+		return Leg3DP.addManagedModel(fullname, Leg3DP.combine(parts))
 	
 	@classmethod
 	def generateFeet(cls, legs):
@@ -220,7 +281,7 @@ class Leg3DP:
 			sk_bot = cq.Sketch().circle(Leg3DP.s_botdia/2)
 			model = cq.CQ().placeSketch( sk_bot, sk_mid.moved(cq.Location(cq.Vector(0,0,Leg3DP.s_both))) ).loft(True)
 			Leg3DP.addManagedModel(modelname, model)
-		a = cq.Assembly()
+		parts = []
 		for l in legs:
-			a.add(model, loc=cq.Location(cq.Vector(l.getKneePos().toVec2().toVec3().toTuple())))
-		return a.toCompound().fuse()
\ No newline at end of file
+			parts += Leg3DP.place(model, l.getKneePos().toVec2().toVec3().toTuple())
+		return Leg3DP.combine(parts)
@@ -1,8 +1,7 @@
-from keycap.helper import KeySizeSpec, KeyMountSpec, KeyMarkSpec
+from keycap.helper import KeySizeSpec, KeyMountSpec, KeyMarkSpec, FrozenSpec
 from keycap.body import KeyBody
-from copy import deepcopy
 
-class KeySpec:
+class KeySpec(FrozenSpec):
 
 	defaults = {
 		'body':		KeyBody(),
@@ -10,22 +9,13 @@ class KeySpec:
 		'mount':	KeyMountSpec(),
 		'mark':		KeyMarkSpec(),
 	}
+	fields = tuple(defaults.keys())
 
 	def __init__(self, **kwargs):
-		defaults = deepcopy(KeySpec.defaults)
-		for a in defaults.keys():
-			setattr(self, a, kwargs.get(a, defaults.get(a)))
+		self._set(**{ a: kwargs.get(a, KeySpec.defaults.get(a)) for a in KeySpec.fields })
 	
 	def clone(self, **kwargs) -> 'KeySpec':
-		new = deepcopy(self)
-		for a in vars(new).keys():
-			if kwargs.get(a) is not None:
-				setattr(new, a, kwargs.get(a))
-		return new
-	
-	def __deepcopy__(self, memo=None) -> 'KeySpec':
-		if memo is None:	memo = {}
-		return KeySpec(**{a[0]:deepcopy(a[1],memo) for a in vars(self).items()})
+		return super().clone(**kwargs)
 	
 	def __str__(self) -> str:
 		return 'KeySpec( {0} )'.format(', '.join(['{0}={1}'.format(a[0],a[1]) for a in vars(self).items()]))
\ No newline at end of file
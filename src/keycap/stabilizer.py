@@ -1,7 +1,7 @@
 import cadquery as cq
 from keycap import mount
 from keycap.spec import KeySpec
-from keycap.helper import KeySizeSpec
+from keycap.helper import KeySizeSpec, memoizeModel
 from keycap.vector import Vec2
 import math
 
@@ -34,6 +34,10 @@ def getMinNegU(gap:float=0, size:float=19.05):
 	return max(1,math.floor(gap/qU)/4+0.75)
 
 
+def getStabKey(spec:KeySpec=KeySpec(), height:bool=False):
+	return (spec.mount.mxMount, spec.size.units.toTuple(), spec.size.spacing.toTuple()) + ((spec.body.height,) if height else ())
+
+
 def canStabilize(unitX:float=1, unitY:float=1):
 	return unitX >= 2 or unitY >= 2
 
@@ -41,6 +45,7 @@ def canStabilize1(units:Vec2=Vec2(1,1)):
 	return units.x >= 2 or units.y >= 2
 
 
+@memoizeModel()
 def makeStabilizer(unitX:float=2, unitY:float=2, chocMount:bool=False):
 	stem = mount.makeCherryStem(isBox=True) if not chocMount else mount.makeCherryStem(isBox=True, thin=1.0, long=4.0, h=2.2)
 	gapX = getCherryGap(unitX) if not chocMount else getChocGap(unitX)
@@ -56,6 +61,7 @@ def getStabPoints(spec:KeySpec=KeySpec()) -> list[Vec2]:
 	stabY = [Vec2(0,gapY), Vec2(0,-gapY)]
 	return stabX+stabY if gapX and gapY else stabX if gapX else stabY
 
+@memoizeModel(key=getStabKey)
 def makeStabilizer1(spec:KeySpec=KeySpec()):
 	stem = mount.makeCherryStem(isBox=True) if spec.mount.mxMount else mount.makeCherryStem(isBox=True, thin=1.0, long=4.0, h=2.2)
 	stab, points = cq.CQ("XY"), getStabPoints(spec)
@@ -65,6 +71,7 @@ def makeStabilizer1(spec:KeySpec=KeySpec()):
 
 makeStab = makeStabilizer1
 
+@memoizeModel(key=lambda spec=KeySpec() : getStabKey(spec, height=True))
 def makeStabilizerSupport(spec:KeySpec=KeySpec()):
 	stem = mount.makeCherrySupport(height=spec.body.height, isBox=True, long=4.1 if spec.mount.mxMount else 4.0)
 	supp, points = cq.CQ("XY"), getStabPoints(spec)
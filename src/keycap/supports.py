@@ -0,0 +1,238 @@
+import math
+import warnings
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cadquery as cq
+from keycap import mesh
+from keycap.boolean import BooleanBatch, makeCompound
+from keycap.cache import getHash, getSourceVersion
+from keycap.parallel import shape2brep, brep2shape
+from keycap.print3d import Leg3DP
+from keycap.vector import Vec2, Vec3
+
+
+'''
+Support planning for resin printing a keycap at a tilt.
+
+SupportPlanner.generate() tilts a built keycap the same way as
+helper.apply3DPTilt(), lifts it off the plate, and meshes it coarsely.
+It then casts a vertical ray up from every point of an XY grid; where
+the first surface a ray meets faces down more steeply than overhang
+allows, that point becomes a contact. Each contact gets a Leg3DP knee
+leaning towards the middle of the cap, a shin down to the plate and a
+foot, and everything is fused onto the cap. Knee directions and shin
+heights are quantized, so the same few leg models are reused through
+Leg3DP's model bank.
+
+A leg whose shin or knee would run through the cap is turned to the nearest
+direction that clears it, checked by casting the same vertical rays at the
+knee and halfway along it. Contacts that no direction clears, or that sit
+too low for a leg, are left unsupported and listed in dropped.
+
+generateIter() supports a whole set, fanned out to a process pool like
+parallel.buildIter(), and caches the supported models when given a key
+for every model.
+'''
+
+
+def getLowestHits(points:np.ndarray, triangles:np.ndarray, chunk:int=1<<19) -> tuple:
+	'''
+	For every (x, y) in points (G,2), find the lowest of triangles (T,3,3) hit by
+	a vertical line through it. Returns the hit heights (inf where nothing was
+	hit) and the index of the triangle hit.
+	'''
+	a, b, c = triangles[:,0], triangles[:,1], triangles[:,2]
+	e0, e1 = b-a, c-a
+	det = e0[:,0]*e1[:,1] - e0[:,1]*e1[:,0]
+	valid = np.abs(det) > 1e-12 # vertical triangles can't be hit from below
+	det = np.where(valid, det, 1)
+	z, index = np.full(len(points), np.inf), np.zeros(len(points), dtype=np.int64)
+	step = max(1, chunk//max(1, len(triangles)))
+	for i in range(0, len(points), step):
+		d = points[i:i+step,None,:] - a[None,:,:2]
+		u = (d[...,0]*e1[:,1] - d[...,1]*e1[:,0])/det
+		v = (e0[:,0]*d[...,1] - e0[:,1]*d[...,0])/det
+		h = np.where(valid & (u >= 0) & (v >= 0) & (u+v <= 1), a[:,2] + u*e0[:,2] + v*e1[:,2], np.inf)
+		index[i:i+step] = np.argmin(h, axis=1)
+		z[i:i+step] = h[np.arange(len(h)), index[i:i+step]]
+	return z, index
+
+
+class SupportPlanner:
+
+	def __init__(self,
+		tilt:float=35,			# see helper.apply3DPTilt()
+		tiltY:float=None,
+		lift:float=5.0,			# lowest point of the cap above the plate
+		spacing:float=2.0,		# XY grid the contacts are sampled on
+		overhang:float=50,		# surfaces facing within this many degrees of straight down get supported
+		legWidth:float=1.0,		# horizontal reach of a knee
+		tip:float=1.5,
+		angleStep:float=45,		# knee direction quantization (deg)
+		heightStep:float=0.25,	# shin height quantization; must stay under Leg3DP.s_both
+		tolerance:float=0.05,	# meshing tolerance used for sampling
+	):
+		self.tilt = tilt
+		self.tiltY = tiltY if isinstance(tiltY, (int, float)) else tilt
+		self.lift = lift
+		self.spacing = spacing
+		self.overhang = overhang
+		self.legWidth = legWidth
+		self.tip = tip
+		self.angleStep = angleStep
+		self.heightStep = heightStep
+		self.tolerance = tolerance
+		self.dropped = [] # (contact, reason) left out by the last getLegs()
+
+	def orient(self, model) -> cq.Workplane:
+		'''
+		Return model tilted for printing, with its lowest point at lift.
+		'''
+		model = model if isinstance(model, cq.Workplane) else cq.CQ(model)
+		model = (model
+			.rotate((0,0,0), (0,0,1), self.tilt)
+			.rotate((0,0,0), (0,1,0), self.tiltY)
+			.rotate((0,0,0), (0,0,1), -self.tilt)
+		)
+		return model.translate((0, 0, self.lift-model.val().BoundingBox().zmin))
+
+	def getTriangles(self, model) -> np.ndarray:
+		'''
+		Return the (T,3,3) triangles of a coarse mesh of model.
+		'''
+		vertices, triangles = mesh.tessellate(model, self.tolerance, 0.3)
+		return vertices[triangles]
+
+	def getContacts(self, tris:np.ndarray) -> np.ndarray:
+		'''
+		Return the (N,3) contact points for the triangles of an oriented model.
+		'''
+		vertices, triangles = tris.reshape(-1,3), np.arange(len(tris)*3).reshape(-1,3)
+		down = mesh.getNormals(vertices, triangles)[:,2] < -math.cos(math.radians(self.overhang))
+		if not down.any():
+			return np.zeros((0,3))
+		lo, hi = tris[down][...,:2].reshape(-1,2).min(axis=0), tris[down][...,:2].reshape(-1,2).max(axis=0)
+		gx, gy = (np.arange(math.floor(lo[i]/self.spacing), math.ceil(hi[i]/self.spacing)+1)*self.spacing for i in range(2))
+		points = np.stack(np.meshgrid(gx, gy), axis=-1).reshape(-1,2)
+		z, index = getLowestHits(points, tris)
+		hit = np.isfinite(z) & down[index]
+		return np.column_stack((points[hit], z[hit]))
+
+	def isClear(self, leg:Leg3DP, tris:np.ndarray) -> bool:
+		'''
+		Whether nothing of the model is below the leg at its knee, or halfway
+		along the angled part of it.
+		'''
+		knee = leg.getKneePos()
+		mid = (leg.pos+knee)*0.5
+		z, _ = getLowestHits(np.array([[knee.x, knee.y], [mid.x, mid.y]]), tris)
+		return bool(z[0] > knee.z+Leg3DP.s_middia and z[1] > mid.z+Leg3DP.s_middia)
+
+	def getLegs(self, contacts:np.ndarray, center:Vec2=Vec2(), tris:np.ndarray=None) -> list[Leg3DP]:
+		'''
+		Return a leg for every contact, leaning towards center where possible.
+		If tris is given, legs are turned away from the model as needed.
+		'''
+		legs = []
+		self.dropped = []
+		steps = max(1, round(360/self.angleStep))
+		for x, y, z in contacts.tolist():
+			toCenter = center-Vec2(x, y)
+			angle = round(toCenter.ang()/self.angleStep)*self.angleStep%360 if toCenter.mag() > 0 else 0
+			leg = Leg3DP(h=z, w=self.legWidth, pos=Vec3(x, y, z), angle=angle, tip=self.tip)
+			if leg.getKneePos().z <= Leg3DP.s_both+self.heightStep:
+				self.dropped.append(((x, y, z), 'too low'))
+				continue
+			if tris is not None:
+				# nearest directions first: angle, angle+step, angle-step, ...
+				turns = [0] + [t*d for t in range(1, steps//2+1) for d in (1, -1)][:steps-1]
+				leg = next((l for l in (leg.clone(angle=(angle+t*self.angleStep)%360) for t in turns) if self.isClear(l, tris)), None)
+				if leg is None:
+					self.dropped.append(((x, y, z), 'blocked'))
+					continue
+			legs.append(leg)
+		return legs
+
+	def makeSupports(self, legs:list[Leg3DP]) -> list:
+		'''
+		Return the knee, shin and foot models for legs, placed.
+		'''
+		parts = []
+		for l in legs:
+			knee = l.getKneePos()
+			h = math.floor(knee.z/self.heightStep)*self.heightStep
+			parts.append(l.generateKnee().translate(l.pos.toTuple()))
+			parts.append(Leg3DP.generateShin(h).translate(knee.toTuple()))
+		if legs:
+			parts.append(Leg3DP.generateFeet(legs))
+		return parts
+
+	def generate(self, model) -> cq.Workplane:
+		'''
+		Return model oriented for printing and fused with its supports, or just
+		gathered into one compound with them if Leg3DP.s_fuse is 'none'.
+		'''
+		oriented = self.orient(model)
+		bb = oriented.val().BoundingBox()
+		tris = self.getTriangles(oriented)
+		legs = self.getLegs(self.getContacts(tris), Vec2((bb.xmin+bb.xmax)/2, (bb.ymin+bb.ymax)/2), tris)
+		if self.dropped:
+			warnings.warn('{0} of {1} support contacts left unsupported ({2})'.format(len(self.dropped), len(self.dropped)+len(legs),
+				', '.join('{0} {1}'.format(n, r) for r, n in Counter(r for _, r in self.dropped).items())))
+		supports = self.makeSupports(legs)
+		if Leg3DP.s_fuse == 'none':
+			return cq.CQ(makeCompound([oriented] + supports))
+		return BooleanBatch().fuse(*supports).apply(oriented)
+
+	def getSettings(self) -> dict:
+		return { k: v for k, v in vars(self).items() if k != 'dropped' }
+
+	def getKey(self, modelKey:str) -> str:
+		# cache key for the supported version of the model identified by modelKey
+		return getHash({
+			'model':	modelKey,
+			'planner':	self.getSettings(),
+			'legs':		Leg3DP.getSettings(),
+			'source':	getSourceVersion(),
+		})
+
+	def generateIter(self, models:dict, keys:dict=None, workers:int=1, cache=None):
+		'''
+		Support every model (label -> model), yielding (label, supported model)
+		as each one is done; cache hits first, then in completion order. With
+		keys (label -> a key identifying the unsupported model, e.g. its
+		BrepCache key) and a BrepCache, supported models are loaded from and
+		stored to the cache under that key plus the planner and leg settings.
+		'''
+		todo, cacheKeys = {}, {}
+		for label, model in models.items():
+			if cache is not None and keys is not None:
+				cacheKeys[label] = self.getKey(keys[label])
+				supported = cache.get(cacheKeys[label])
+				if supported is not None:
+					yield label, supported
+					continue
+			todo[label] = model
+
+		if workers is None or workers <= 1 or len(todo) <= 1:
+			for label, model in todo.items():
+				supported = self.generate(model)
+				if label in cacheKeys: cache.put(cacheKeys[label], supported)
+				yield label, supported
+		else:
+			with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+				futures = { pool.submit(supportJob, shape2brep(model), self): label for label, model in todo.items() }
+				for f in as_completed(futures):
+					label, data = futures[f], f.result()
+					if label in cacheKeys: cache.putBrep(cacheKeys[label], data)
+					yield label, brep2shape(data)
+
+
+def addSupports(model, tilt:float=35, **kwargs) -> cq.Workplane:
+	return SupportPlanner(tilt, **kwargs).generate(model)
+
+
+def supportJob(data:bytes, planner:SupportPlanner) -> bytes:
+	# generateIter() in a worker process; models travel as BREP like parallel.buildJob()
+	return shape2brep(planner.generate(brep2shape(data)))
@@ -0,0 +1,206 @@
+import os
+import json
+import threading
+import cadquery as cq
+from time import perf_counter
+from contextlib import contextmanager
+
+
+'''
+Opt-in tracing for the geometry pipeline.
+
+Generators wrap their expensive steps in stage(), which yields a span
+that records wall time, OCC boolean count and, when given the models
+going in and out, their face/edge counts. This costs nothing unless a
+recorder is active via recording(); recorders are any object with an
+onSpan(span) method, e.g. StageRecorder for timings or Tracer for a
+full Chrome trace (chrome://tracing, ui.perfetto.dev).
+'''
+
+
+_recorders = []
+_stack = []
+_booleans = [0]
+_boolOp = None
+
+
+# BOOLEAN COUNTING
+
+def _countingBoolOp(self, *args, **kwargs):
+	_booleans[0] += 1
+	return _boolOp(self, *args, **kwargs)
+
+def _patchBooleans(enable:bool):
+	# every Shape.cut/fuse/intersect (and so every Workplane boolean) goes through _bool_op
+	global _boolOp
+	if enable and _boolOp is None and hasattr(cq.Shape, '_bool_op'):
+		_boolOp = cq.Shape._bool_op
+		cq.Shape._bool_op = _countingBoolOp
+	elif not enable and _boolOp is not None:
+		cq.Shape._bool_op = _boolOp
+		_boolOp = None
+
+
+def countTopology(model) -> tuple:
+	'''
+	Return the (faces, edges) count of a Workplane or Shape.
+	'''
+	shapes = [o for o in model.vals() if isinstance(o, cq.Shape)] if isinstance(model, cq.Workplane) else [model]
+	return sum(len(s.Faces()) for s in shapes), sum(len(s.Edges()) for s in shapes)
+
+
+# SPANS
+
+class Span:
+
+	__slots__ = ('name', 'start', 'duration', 'depth', 'pid', 'tid', 'args', '_overhead')
+
+	def __init__(self, name:str, start:float=0.0, duration:float=0.0, depth:int=0, pid:int=None, tid:int=None, args:dict=None):
+		self.name = name
+		self.start = start
+		self.duration = duration
+		self.depth = depth
+		self.pid = pid if pid is not None else os.getpid()
+		self.tid = tid if tid is not None else threading.get_ident()
+		self.args = args if args is not None else {}
+		self._overhead = 0.0
+
+	def inp(self, model):
+		t = perf_counter()
+		self.args['facesIn'], self.args['edgesIn'] = countTopology(model)
+		self._overhead += perf_counter()-t
+		return model
+
+	def out(self, model):
+		t = perf_counter()
+		self.args['facesOut'], self.args['edgesOut'] = countTopology(model)
+		self._overhead += perf_counter()-t
+		return model
+
+	def toDict(self) -> dict:
+		return { a: getattr(self, a) for a in ('name', 'start', 'duration', 'depth', 'pid', 'tid', 'args') }
+
+	@classmethod
+	def fromDict(cls, d:dict) -> 'Span':
+		return cls(**d)
+
+
+class _NullSpan:
+	# stands in for a Span when nothing is recording
+
+	args = {}
+
+	def inp(self, model):
+		return model
+
+	def out(self, model):
+		return model
+
+_NULL = _NullSpan()
+
+
+@contextmanager
+def stage(name:str, model=None):
+	if not _recorders:
+		yield _NULL
+		return
+	span = Span(name, depth=len(_stack))
+	if model is not None:
+		span.inp(model)
+	_stack.append(span)
+	b, pre = _booleans[0], span._overhead
+	span.start = perf_counter()
+	try:
+		yield span
+	finally:
+		span.duration = perf_counter()-span.start-(span._overhead-pre)
+		if _boolOp is not None:
+			span.args['booleans'] = _booleans[0]-b
+		_stack.pop()
+		if _stack:
+			_stack[-1]._overhead += span._overhead
+		emit(span)
+
+
+def emit(span:Span):
+	for r in list(_recorders):
+		r.onSpan(span)
+
+
+def isRecording() -> bool:
+	return len(_recorders) > 0
+
+
+@contextmanager
+def recording(recorder=None):
+	r = recorder if recorder is not None else StageRecorder()
+	_recorders.append(r)
+	_patchBooleans(True)
+	try:
+		yield r
+	finally:
+		_recorders.remove(r)
+		if not _recorders:
+			_patchBooleans(False)
+
+
+def reset():
+	'''
+	Drop every active recorder, e.g. in a freshly forked worker process.
+	'''
+	_recorders.clear()
+	_stack.clear()
+	_patchBooleans(False)
+
+
+# RECORDERS
+
+class StageRecorder:
+
+	def __init__(self):
+		self.times = {} # stage name -> list of durations (s)
+
+	def onSpan(self, span:Span):
+		self.add(span.name, span.duration)
+
+	def add(self, name:str, seconds:float):
+		self.times.setdefault(name, []).append(seconds)
+
+	def getTotals(self) -> dict:
+		return { name: sum(t) for name, t in self.times.items() }
+
+
+class Tracer:
+
+	def __init__(self):
+		self.spans = []
+		self.listeners = []
+
+	def addListener(self, fn):
+		'''
+		Call fn(span) for every span as it completes.
+		'''
+		self.listeners.append(fn)
+		return fn
+
+	def onSpan(self, span:Span):
+		self.spans.append(span)
+		for fn in self.listeners:
+			fn(span)
+
+	def toChrome(self) -> dict:
+		t0 = min((s.start for s in self.spans), default=0)
+		return { 'traceEvents': [{
+			'name':	s.name,
+			'cat':	'keycap',
+			'ph':	'X',
+			'ts':	(s.start-t0)*1e6,
+			'dur':	s.duration*1e6,
+			'pid':	s.pid,
+			'tid':	s.tid,
+			'args':	s.args,
+		} for s in self.spans], 'displayTimeUnit': 'ms' }
+
+	def saveChrome(self, path:str):
+		with open(path, 'w') as f:
+			json.dump(self.toChrome(), f)
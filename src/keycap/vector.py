@@ -1,38 +1,58 @@
 import math
 import numpy as np
-from copy import deepcopy
+from functools import lru_cache
+
+
+# ROTATION
+
+@lru_cache(maxsize=512)
+def getSinCos(angle:float) -> tuple:
+	t = math.radians(angle)
+	return math.sin(t), math.cos(t)
+
+@lru_cache(maxsize=512)
+def getRotation(axis:str, angle:float) -> np.ndarray:
+	'''
+	Return the (read-only) 3x3 matrix M for which pos @ M equals Vec3.rotateX/Y/Z(angle),
+	depending on axis ('x', 'y' or 'z').
+	'''
+	s, c = getSinCos(angle)
+	m = np.array({
+		'x': [[1.,  0,  0],  [0 ,  c, -s],  [0 ,  s,  c]],
+		'y': [[c,  0,  -s],  [0,  1,   0],  [s,  0,   c]],
+		'z': [[c, -s,  0 ],  [s,  c,  0 ],  [0,  0,  1.]],
+	}[axis])
+	m.flags.writeable = False
+	return m
 
 
 # VECTOR 2
 
 class Vec2:
-	
+
+	__slots__ = ('x', 'y')
+
 	def __init__(self, x:float=0, y:float=0) -> 'Vec2':
 		self.x:float = x
 		self.y:float = y
-	
+
 	def clone(self, x=None, y=None) -> 'Vec2':
-		args = locals()
-		new = deepcopy(self)
-		for a in args.keys()^['self']:
-			if args.get(a) is not None:
-				setattr(new, a, args.get(a))
-		return new
-	
+		return Vec2(self.x if x is None else x, self.y if y is None else y)
+
 	def toTuple(self) -> tuple:
 		return (self.x, self.y)
-	
+
 	def toVec3(self) -> 'Vec3':
 		return Vec3(self.x, self.y, 0)
-	
+
 	def mag(self) -> float:
 		return math.sqrt(self.x*self.x + self.y*self.y)
-	
+
 	def setMag(self, mag:float) -> 'Vec2':
 		m = mag/self.mag()
 		self.x, self.y = self.x*m, self.y*m
 		return self
-	
+
 	def ang(self) -> float:
 		if self.y == 0:
 			return 0 if self.x >= 0 else 180
@@ -40,90 +60,209 @@ class Vec2:
 			return 90 if self.y >= 0 else 270
 		a = math.degrees(math.atan(self.y/self.x))
 		return 180+a if self.x < 0 else a%360
-	
+
 	def rotate(self, angle:float) -> 'Vec2':
-		t = math.radians(angle)
-		xs, xc, ys, yc = self.x*math.sin(t), self.x*math.cos(t), self.y*math.sin(t), self.y*math.cos(t)
-		self.x, self.y = xc-ys, xs+yc
+		s, c = getSinCos(angle)
+		self.x, self.y = self.x*c-self.y*s, self.x*s+self.y*c
 		return self
-	
+
 	def __deepcopy__(self, memo=None) -> 'Vec2':
-		return Vec2(deepcopy(self.x),deepcopy(self.y))
-	
+		return Vec2(self.x, self.y)
+
 	def __str__(self) -> str:
 		return "Vec2({0},{1})".format(self.x, self.y)
-	
+
 	def __add__(self, o) -> 'Vec2':
-		return Vec2(self.x+o, self.y+o) if isinstance(o,(float,int)) else Vec2(self.x+o.x, self.y+o.y) if isinstance(o,(Vec2,Vec3)) else TypeError
-	
+		if type(o) in _VECS:			return Vec2(self.x+o.x, self.y+o.y)
+		if isinstance(o, (float,int)):	return Vec2(self.x+o, self.y+o)
+		return NotImplemented
+
 	def __sub__(self, o) -> 'Vec2':
-		return Vec2(self.x-o, self.y-o) if isinstance(o,(float,int)) else Vec2(self.x-o.x, self.y-o.y) if isinstance(o,(Vec2,Vec3)) else TypeError
-	
+		if type(o) in _VECS:			return Vec2(self.x-o.x, self.y-o.y)
+		if isinstance(o, (float,int)):	return Vec2(self.x-o, self.y-o)
+		return NotImplemented
+
 	def __mul__(self, o) -> 'Vec2':
-		return Vec2(self.x*o, self.y*o) if isinstance(o,(float,int)) else Vec2(self.x*o.x, self.y*o.y) if isinstance(o,(Vec2,Vec3)) else TypeError
-	
+		if type(o) in _VECS:			return Vec2(self.x*o.x, self.y*o.y)
+		if isinstance(o, (float,int)):	return Vec2(self.x*o, self.y*o)
+		return NotImplemented
+
 	def __truediv__(self, o) -> 'Vec2':
-		return Vec2(self.x/o, self.y/o) if isinstance(o,(float,int)) else Vec2(self.x/o.x, self.y/o.y) if isinstance(o,(Vec2,Vec3)) else TypeError
+		if type(o) in _VECS:			return Vec2(self.x/o.x, self.y/o.y)
+		if isinstance(o, (float,int)):	return Vec2(self.x/o, self.y/o)
+		return NotImplemented
 
 
 # VECTOR 3
 
 class Vec3:
-	
+
+	__slots__ = ('x', 'y', 'z')
+
 	def __init__(self, x:float=0, y:float=0, z:float=0):
 		self.x = x
 		self.y = y
 		self.z = z
-	
+
 	def clone(self, x=None, y=None, z=None):
-		args = locals()
-		new = deepcopy(self)
-		for a in args.keys()^['self']:
-			if args.get(a) is not None:
-				setattr(new, a, args.get(a))
-		return new
-	
+		return Vec3(self.x if x is None else x, self.y if y is None else y, self.z if z is None else z)
+
 	def toTuple(self):
 		return (self.x, self.y, self.z)
-	
+
 	def toVec2(self):
 		return Vec2(self.x, self.y)
-	
+
 	def mag(self):
 		return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
-	
+
 	def rotateX(self, angle):
-		c, s, pos = np.cos(math.radians(angle)), np.sin(math.radians(angle)), [self.x,self.y,self.z]
-		new = np.dot(pos, np.array([[1.,  0,  0],  [0 ,  c, -s],  [0 ,  s,  c]]))
-		self.x, self.y, self.z = new
+		s, c = getSinCos(angle)
+		self.y, self.z = self.y*c + self.z*s, self.z*c - self.y*s
 		return self
-	
+
 	def rotateY(self, angle):
-		c, s, pos = np.cos(math.radians(angle)), np.sin(math.radians(angle)), [self.x,self.y,self.z]
-		new = np.dot(pos, np.array([[c,  0,  -s],  [0,  1,   0],  [s,  0,   c]]))
-		self.x, self.y, self.z = new
+		s, c = getSinCos(angle)
+		self.x, self.z = self.x*c + self.z*s, self.z*c - self.x*s
 		return self
-	
+
 	def rotateZ(self, angle):
-		c, s, pos = np.cos(math.radians(angle)), np.sin(math.radians(angle)), [self.x,self.y,self.z]
-		new = np.dot(pos, np.array([[c, -s,  0 ],  [s,  c,  0 ],  [0,  0,  1.]]))
-		self.x, self.y, self.z = new
+		s, c = getSinCos(angle)
+		self.x, self.y = self.x*c + self.y*s, self.y*c - self.x*s
 		return self
-	
+
 	def __deepcopy__(self, memo=None):
-		return Vec3(deepcopy(self.x),deepcopy(self.y),deepcopy(self.z))
-	
+		return Vec3(self.x, self.y, self.z)
+
 	def __str__(self):
 		return "Vec3({0},{1},{2})".format(self.x, self.y, self.z)
-	
+
+	# Vec2 operands leave z untouched
+
 	def __add__(self, o):
-		return Vec3(self.x+o, self.y+o, self.z+o) if isinstance(o,(float,int)) else Vec3(self.x+o.x, self.y+o.y, self.z) if isinstance(o,(Vec2)) else Vec3(self.x+o.x, self.y+o.y, self.z+o.z) if isinstance(o,(Vec3)) else TypeError 
-	
+		t = type(o)
+		if t is Vec3:					return Vec3(self.x+o.x, self.y+o.y, self.z+o.z)
+		if t is Vec2:					return Vec3(self.x+o.x, self.y+o.y, self.z)
+		if isinstance(o, (float,int)):	return Vec3(self.x+o, self.y+o, self.z+o)
+		return NotImplemented
+
 	def __sub__(self, o):
-		return Vec3(self.x-o, self.y-o, self.z-o) if isinstance(o,(float,int)) else Vec3(self.x-o.x, self.y-o.y, self.z) if isinstance(o,(Vec2)) else Vec3(self.x-o.x, self.y-o.y, self.z-o.z) if isinstance(o,(Vec3)) else TypeError
-	
+		t = type(o)
+		if t is Vec3:					return Vec3(self.x-o.x, self.y-o.y, self.z-o.z)
+		if t is Vec2:					return Vec3(self.x-o.x, self.y-o.y, self.z)
+		if isinstance(o, (float,int)):	return Vec3(self.x-o, self.y-o, self.z-o)
+		return NotImplemented
+
 	def __mul__(self, o):
-		return Vec3(self.x*o, self.y*o, self.z*o) if isinstance(o,(float,int)) else Vec3(self.x*o.x, self.y*o.y, self.z) if isinstance(o,(Vec2)) else Vec3(self.x*o.x, self.y*o.y, self.z*o.z) if isinstance(o,(Vec3)) else TypeError
-	
+		t = type(o)
+		if t is Vec3:					return Vec3(self.x*o.x, self.y*o.y, self.z*o.z)
+		if t is Vec2:					return Vec3(self.x*o.x, self.y*o.y, self.z)
+		if isinstance(o, (float,int)):	return Vec3(self.x*o, self.y*o, self.z*o)
+		return NotImplemented
+
 	def __truediv__(self, o):
-		return Vec3(self.x/o, self.y/o, self.z/o) if isinstance(o,(float,int)) else Vec3(self.x/o.x, self.y/o.y, self.z) if isinstance(o,(Vec2)) else Vec3(self.x/o.x, self.y/o.y, self.z/o.z) if isinstance(o,(Vec3)) else TypeError
+		t = type(o)
+		if t is Vec3:					return Vec3(self.x/o.x, self.y/o.y, self.z/o.z)
+		if t is Vec2:					return Vec3(self.x/o.x, self.y/o.y, self.z)
+		if isinstance(o, (float,int)):	return Vec3(self.x/o, self.y/o, self.z/o)
+		return NotImplemented
+
+
+_VECS = (Vec2, Vec3)
+
+
+# VECTOR ARRAY
+
+class VecArray:
+	'''
+	Batch of 3D points backed by an (N,3) ndarray. Mirrors the Vec3 API
+	(rotations in-place, arithmetic returning new arrays, Vec2 operands
+	leaving z untouched), so code like helper.apply3DPTilt() can transform
+	many points in one vectorized call.
+	'''
+
+	__slots__ = ('a',)
+
+	def __init__(self, points=()):
+		if isinstance(points, np.ndarray):
+			self.a = np.array(points, dtype=float).reshape(-1, 3)
+		else:
+			self.a = np.array([(p.x, p.y, getattr(p, 'z', 0)) if type(p) in _VECS else p for p in points], dtype=float).reshape(-1, 3)
+
+	def clone(self) -> 'VecArray':
+		return VecArray(self.a)
+
+	def toArray(self) -> np.ndarray:
+		return self.a
+
+	def toVec3s(self) -> list[Vec3]:
+		return [Vec3(*p) for p in self.a.tolist()]
+
+	def __len__(self) -> int:
+		return len(self.a)
+
+	def __getitem__(self, i) -> Vec3:
+		return Vec3(*self.a[i].tolist())
+
+	def __iter__(self):
+		return iter(self.toVec3s())
+
+	def __str__(self) -> str:
+		return "VecArray({0})".format(len(self.a))
+
+	@property
+	def x(self) -> np.ndarray:
+		return self.a[:,0]
+
+	@property
+	def y(self) -> np.ndarray:
+		return self.a[:,1]
+
+	@property
+	def z(self) -> np.ndarray:
+		return self.a[:,2]
+
+	def mag(self) -> np.ndarray:
+		return np.linalg.norm(self.a, axis=1)
+
+	def getMin(self) -> Vec3:
+		return Vec3(*self.a.min(axis=0).tolist())
+
+	def getMax(self) -> Vec3:
+		return Vec3(*self.a.max(axis=0).tolist())
+
+	def rotateX(self, angle) -> 'VecArray':
+		self.a = self.a @ getRotation('x', angle)
+		return self
+
+	def rotateY(self, angle) -> 'VecArray':
+		self.a = self.a @ getRotation('y', angle)
+		return self
+
+	def rotateZ(self, angle) -> 'VecArray':
+		self.a = self.a @ getRotation('z', angle)
+		return self
+
+	def translate(self, o) -> 'VecArray':
+		self.a += VecArray._operand(o, 0)
+		return self
+
+	@staticmethod
+	def _operand(o, fill:float):
+		t = type(o)
+		if t is VecArray:	return o.a
+		if t is Vec3:		return np.array((o.x, o.y, o.z))
+		if t is Vec2:		return np.array((o.x, o.y, fill))
+		return o
+
+	def __add__(self, o) -> 'VecArray':
+		return VecArray(self.a + VecArray._operand(o, 0))
+
+	def __sub__(self, o) -> 'VecArray':
+		return VecArray(self.a - VecArray._operand(o, 0))
+
+	def __mul__(self, o) -> 'VecArray':
+		return VecArray(self.a * VecArray._operand(o, 1))
+
+	def __truediv__(self, o) -> 'VecArray':
+		return VecArray(self.a / VecArray._operand(o, 1))
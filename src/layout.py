@@ -0,0 +1,246 @@
+import GLK
+import re
+import csv
+import json
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs
+from os.path import join
+from time import perf_counter
+from keycap.cache import BrepCache
+from keycap.helper import KeyMarkShape, makeInstancedAssembly
+from keycap.parallel import exportJob, shape2brep
+from keycap.vector import Vec2
+
+
+'''
+Build only the GLK caps one keyboard needs.
+
+Reads a layout, turns every key into a KeySpec, builds each distinct spec
+once and writes it next to a bill of materials (bom.csv) saying how many of
+each part the keyboard takes, e.g.
+
+	python layout.py ergodox.json --rotated-row R3 --out export/ergodox --workers 4
+	python layout.py glfc.txt --mx --step --assembly
+
+Layouts are either KLE JSON (keyboard-layout-editor.com, Download JSON or
+the raw data) or a plain table with one row per line, the row's profile row
+first and then its keys as width[xheight][*count][:tag], e.g.
+
+	R4	1*13 2
+	R3	1.5 1*12 1.5
+	R2	1.75 1*3 1:home 1*2 1:home 1*3 2.25
+	R1	2.25 1*10 2.75
+	R1	1.25*3 6.25:space 1.25:windows 1.25*3
+
+Tags are home, numhome, windows, convex and space. In KLE layouts the
+bottom two rows are R1 and the rows above are R2, R3 and then R4 for the
+rest, unless a key's profile (p) names a row. Rotated clusters such as
+thumb clusters take the row their profile names, or --rotated-row. Homing
+keys (n) get dots, Win/Super legends the windows mark and keys 4U or wider
+a space scoop.
+
+--assembly also writes the whole keyboard as one STEP assembly, in which
+every part is stored once and instanced at each of its keys.
+'''
+
+
+TAGS = ('home', 'numhome', 'windows', 'convex', 'space')
+WINDOWS_LEGENDS = ('win', 'windows', 'super', 'gui', 'meta', 'cmd', '⊞')
+
+
+# LAYOUTS
+
+def parseTable(text:str) -> list[tuple]:
+	'''
+	Return (row, units, tag, position) for every key in a layout table.
+	'''
+	keys = []
+	y = 0
+	for n, line in enumerate(text.splitlines()):
+		tokens = line.split('#')[0].split()
+		if not tokens:
+			continue
+		x = 0
+		row = tokens[0].upper()
+		if row not in GLK.rows:
+			raise ValueError("line {0}: unknown row '{1}'".format(n+1, tokens[0]))
+		for t in tokens[1:]:
+			m = re.fullmatch(r'([\d.]+)(?:x([\d.]+))?(?:\*(\d+))?(?::(\w+))?', t)
+			if m is None or (m[4] is not None and m[4] not in TAGS):
+				raise ValueError("line {0}: can't read key '{1}'".format(n+1, t))
+			for i in range(int(m[3] or 1)):
+				keys.append((row, Vec2(float(m[1]), float(m[2] or 1)), m[4], Vec2(x, y)))
+				x += float(m[1])
+		y += 1
+	return keys
+
+
+def loadKLE(text:str) -> list:
+	# KLE's raw data is JSON5-ish: unquoted property names, and often no outer brackets
+	text = re.sub(r'([{,]\s*)([A-Za-z_]\w*)\s*:', r'\1"\2":', text)
+	try:
+		data = json.loads(text)
+	except json.JSONDecodeError:
+		data = json.loads('[' + text + ']')
+	return [r for r in data if isinstance(r, list)] # drops the metadata object
+
+
+def parseKLE(text:str, rotatedRow:str=None) -> list[tuple]:
+	'''
+	Return (row, units, tag, position) for every key in a KLE layout. A key's
+	row comes from its profile (p) if that names one, otherwise from how far
+	up the unrotated block its row sits. Rotated clusters, like ErgoDox
+	thumbs, aren't rows of the block, so their keys need a profile naming a
+	row, or rotatedRow; they're placed as if they weren't rotated, from their
+	cluster's rotation origin.
+	'''
+	keys = [] # (row from profile, units, tag, position, rotated, layout row)
+	profile = ''
+	r = rx = ry = x = y = 0
+	for n, row in enumerate(loadKLE(text)):
+		props = {}
+		for k in row:
+			if isinstance(k, dict):
+				props |= k
+				profile = k.get('p', profile) # profile carries over to later keys, like in KLE
+				r = k.get('r', r)
+				if 'rx' in k or 'ry' in k: # a new cluster starts at its rotation origin
+					rx, ry = k.get('rx', rx), k.get('ry', ry)
+					x, y = rx, ry
+				x += k.get('x', 0)
+				y += k.get('y', 0)
+				continue
+			if not props.get('d'): # decals are just labels
+				legend = [l.strip().lower() for l in re.sub(r'<[^>]*>', '', k).split('\n') if l.strip()]
+				units = Vec2(props.get('w', 1), props.get('h', 1))
+				tag = 'home' if props.get('n') else 'windows' if set(legend)&set(WINDOWS_LEGENDS) else 'space' if units.x >= 4 else None
+				m = re.search(r'R[1-4]', profile.upper())
+				keys.append((m[0] if m else None, units, tag, Vec2(x, y), r != 0, n))
+			x += props.get('w', 1)
+			props = {}
+		y += 1
+		x = rx
+
+	# rows of the unrotated block from the bottom: R1, R1, R2, R3 and then R4
+	rowY = {}
+	for row, units, tag, pos, rotated, n in keys:
+		if not rotated:
+			rowY.setdefault(n, []).append(pos.y)
+	rowY = { n: round(sorted(ys)[len(ys)//2], 2) for n, ys in rowY.items() } # median, so staggered columns don't split a row
+	levels = sorted(set(rowY.values()), reverse=True)
+	out = []
+	for row, units, tag, pos, rotated, n in keys:
+		if row is None and rotated:
+			if rotatedRow is None:
+				raise ValueError("row {0}: rotated key at {1:g},{2:g} needs a profile (p) naming its row, or a row for rotated keys".format(n+1, pos.x, pos.y))
+			row = rotatedRow
+		elif row is None:
+			fromBottom = levels.index(rowY[n])
+			row = ('R1', 'R1', 'R2', 'R3')[fromBottom] if fromBottom < 4 else 'R4'
+		out.append((row, units, tag, pos))
+	return out
+
+
+def readLayout(path:str, rotatedRow:str=None) -> list[tuple]:
+	with open(path, encoding='utf-8') as f:
+		text = f.read()
+	return parseKLE(text, rotatedRow) if path.lower().endswith('.json') or text.lstrip().startswith(('[', '{')) else parseTable(text)
+
+
+# SPECS
+
+def getTagParams(tag:str, spec) -> dict:
+	convex = { 'ratio':0.6, 'convex':True, 'edge':spec.body.edge.clone(x=0.15) }
+	return {
+		None:		{},
+		'home':		{ 'mark': {'shape':KeyMarkShape.DOTS} },
+		'numhome':	{ 'mark': {'shape':KeyMarkShape.DOTS, 'count':1} },
+		'windows':	{ 'mark': {'shape':KeyMarkShape.WINDOWS} },
+		'convex':	{ 'body': convex },
+		'space':	{ 'body': convex | {'angle':9} },
+	}[tag]
+
+
+def getSpecs(keys:list[tuple], mx:bool=False) -> tuple[dict, list]:
+	'''
+	Map keys to specs and dedupe them, returning label -> spec for every
+	distinct spec, and the label of every key.
+	'''
+	specs, labels, keyLabels = {}, {}, []
+	for row, units, tag, pos in keys:
+		rspec = GLK.getRowSpec(row, mx)
+		spec = GLK.apply2spec(rspec, { 'size':{'units':units} } | getTagParams(tag, rspec))
+		if spec not in labels:
+			label = GLK.makeLabel(spec, row, mx, { 'PROFILELABEL':tag } if tag else {})
+			base, n = label, 1
+			while label in specs: # e.g. two KLE profiles naming the same row
+				n += 1
+				label = '{0}_v{1}'.format(base, n)
+			labels[spec] = label
+			specs[label] = spec
+		keyLabels.append(labels[spec])
+	return specs, keyLabels
+
+
+def getPlacements(keys:list[tuple], keyLabels:list, specs:dict) -> list[tuple]:
+	# (label, center) of every key, with +Y up the keyboard like export.py
+	placements = []
+	for (row, units, tag, pos), label in zip(keys, keyLabels):
+		spacing = specs[label].size.spacing
+		placements.append((label, ((pos.x+units.x/2)*spacing.x, -(pos.y+units.y/2)*spacing.y, 0)))
+	return placements
+
+
+def writeBOM(path:str, specs:dict, counts:Counter, files:dict={}):
+	with open(path, 'w', newline='') as f:
+		w = csv.writer(f)
+		w.writerow(['label', 'count', 'units', 'mark', 'files'])
+		for label, spec in specs.items():
+			w.writerow([label, counts[label], GLK.makeUnitStr(spec), spec.mark.shape.name.lower(), ' '.join(files.get(label, []))])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Build the unique GLK caps a keyboard layout needs, plus a bill of materials.')
+	parser.add_argument('layout', help='KLE JSON or layout table')
+	parser.add_argument('--out', default='./export/layout', help='directory for parts and bom.csv')
+	parser.add_argument('--mx', action='store_true', help='MX mounts and stems instead of Kailh Choc')
+	parser.add_argument('--rotated-row', choices=list(GLK.rows), help="row for keys in rotated KLE clusters whose profile (p) doesn't name one")
+	parser.add_argument('--workers', type=int, default=1, help='processes building caps')
+	parser.add_argument('--writers', type=int, default=2, help='processes meshing/writing finished caps')
+	parser.add_argument('--step', action='store_true', help='also write STEP')
+	parser.add_argument('--no-stl', action='store_true', help="don't write STL")
+	parser.add_argument('--tolerance', type=float, default=0.005, help='max mesh deviation (mm)')
+	parser.add_argument('--angular-tolerance', type=float, default=0.05, help='coarsest angular mesh step (rad)')
+	parser.add_argument('--cache', help='BREP cache directory, to reuse builds across runs')
+	parser.add_argument('--assembly', action='store_true', help='also write the whole keyboard as one instanced STEP assembly')
+	parser.add_argument('--bom-only', action='store_true', help='only write the bill of materials')
+	args = parser.parse_args()
+
+	start = perf_counter()
+	keys = readLayout(args.layout, args.rotated_row)
+	specs, keyLabels = getSpecs(keys, args.mx)
+	counts = Counter(keyLabels)
+	makedirs(args.out, exist_ok=True)
+	files, models = {}, {}
+	if not args.bom_only:
+		cache = BrepCache(args.cache) if args.cache else None
+		with ProcessPoolExecutor(max_workers=args.writers) as pool:
+			writes = []
+			for label, model in GLK.buildSpecs(specs, args.workers, cache):
+				models[label] = model
+				stl = None if args.no_stl else join(args.out, label + '.stl')
+				step = join(args.out, label + '.step') if args.step else None
+				files[label] = [p for p in (stl, step) if p is not None]
+				writes.append(pool.submit(exportJob, shape2brep(model), stl=stl, step=step,
+					tolerance=args.tolerance, angularTolerance=args.angular_tolerance, adaptive=True))
+			for w in writes:
+				w.result()
+		if args.assembly:
+			makeInstancedAssembly(models, getPlacements(keys, keyLabels, specs), 'keyboard').save(join(args.out, 'assembly.step'), 'STEP')
+	writeBOM(join(args.out, 'bom.csv'), specs, counts, files)
+
+	print('{0} keys, {1} unique parts in {2:.2f}s'.format(sum(counts.values()), len(specs), perf_counter()-start))
+	for label in specs:
+		print('  {0:>4} x {1}'.format(counts[label], label))
@@ -1,6 +1,8 @@
 from os.path import dirname, abspath
 import cadquery as cq
 from cadquery import exporters
+from keycap.cache import BrepCache, build
+from keycap import mesh
 import GLK
 
 
@@ -10,9 +12,20 @@ exportSTL =		False
 exportSTEP =	False
 export_pre =	'{0}/../export/preview'.format(dirname(abspath(__file__)))
 
+# build settings
+fidelity =		'full'		# 'draft' skips edge finish, marks, hollowing and stems; much faster for tweaking shapes
+
 # STL settings
 tol =		0.001
 tolAng =	0.025		# 0.025 decent quality/size trade-off; 0.01 for obscene quality
+adaptive =	True		# adaptiveTol bounds the chord error on every face, so each is only as fine as its curvature needs; tolAng is the coarsest step any face gets
+adaptiveTol =	0.005	# max distance (mm) between mesh and surface when adaptive
+meshTol =	adaptiveTol if adaptive else tol
+
+# cache settings
+useCache =		True
+cacheDir =		'{0}/../.cache/brep'.format(dirname(abspath(__file__)))
+cache =			BrepCache(cacheDir) if useCache else None
 
 
 try:
@@ -21,24 +34,24 @@ except ModuleNotFoundError:
 	pass
 
 
-model = GLK.keycap()
-# model = GLKsimple.keycap()
-# model = GLK.profile(mx=False) 		# generate keys for all officially supported sets
-# model = GLKsimple.profile(mx=False) 	# generate keys for all officially supported sets
+model = build(GLK.keycap, cache, fidelity=fidelity)
+# model = build(GLKsimple.keycap, cache)
+# model = GLK.profile(mx=False, cache=cache, fidelity=fidelity) 		# generate keys for all officially supported sets
+# model = GLKsimple.profile(mx=False, cache=cache) 	# generate keys for all officially supported sets
 
 
 if type(model) in [cq.Workplane, cq.Compound, cq.Assembly]:
 	if 'show_object' in locals():
 		show_object(model)
 	if export:
-		if exportSTL:	exporters.export(model, '{0}.stl'.format(export_pre), tolerance=tol, angularTolerance=tolAng)
+		if exportSTL:	mesh.exportSTL(model.toCompound() if isinstance(model, cq.Assembly) else model, '{0}.stl'.format(export_pre), meshTol, tolAng, adaptive)
 		if exportSTEP:	exporters.export(model, '{0}.step'.format(export_pre))
 else:
 	assembly = cq.Assembly()
 	for i, k in enumerate(model):
 		assembly.add(model[k], loc=cq.Location(cq.Vector(0, 0, 0*19.05)), name=str(k))
 		if export:
-			if exportSTL:	exporters.export(model[k], '{0}_{1}.stl'.format(export_pre, str(k)), tolerance=tol, angularTolerance=tolAng)
+			if exportSTL:	mesh.exportSTL(model[k], '{0}_{1}.stl'.format(export_pre, str(k)), meshTol, tolAng, adaptive)
 			if exportSTEP:	exporters.export(model[k], '{0}_{1}.step'.format(export_pre, str(k)))
 	if 'show_object' in locals():
 		show_object(assembly.toCompound())
\ No newline at end of file
@@ -0,0 +1,357 @@
+import GLK, GLKsimple
+import layout
+import os
+import json
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter, monotonic
+from urllib.parse import urlsplit, parse_qs
+from cadquery import exporters
+from keycap import mesh
+from keycap.cache import BrepCache, getJobKey, getSourceVersion
+from keycap.helper import KeyMarkShape
+from keycap.parallel import buildJob, brep2shape
+from keycap.vector import Vec2, Vec3
+
+
+'''
+Local build service for configurators.
+
+A small asyncio HTTP server around GLK.keycap() and GLKsimple.keycap().
+Builds run on a pool of worker processes that stay up between requests,
+so imports and memoized components are only paid for once. Identical
+requests that arrive while a build is running wait for that build rather
+than starting another, and finished results are kept in memory (and BREP
+optionally on disk), so repeat requests are answered without building.
+
+	python server.py --workers 4 --cache ../.cache/brep
+
+	POST /build?format=stl		(stl, ply, step or brep; default stl)
+	{ "profile":"GLK", "label":"GLK_KL_R2_100x100_home" }
+	{ "profile":"GLK", "row":"R1", "units":[2.25,1], "tag":"space", "mx":true, "body":{"depth":2.2} }
+	{ "profile":"GLKS", "args":{ "unitX":1.5, "scoopAngle":3 } }
+
+	GET /stats					cache and queue counters
+	GET /health
+
+GLK keys are described as in layout.py: a row, a size in units and an
+optional tag, with optional body/mount/mark overrides on top. Responses
+carry X-Build-Key and X-Cache (hit, miss or joined) headers.
+
+Workers are spawned fresh rather than forked, so they load the source as it
+is on disk. Job keys are pinned to that source version; when the source
+changes the pool is replaced (at most once per --reload-check seconds) so
+new builds never run old code under a new key.
+'''
+
+
+GENERATORS = (GLK.keycap, GLKsimple.keycap)
+FORMATS = {
+	'stl':	'model/stl',
+	'ply':	'application/octet-stream',
+	'step':	'model/step',
+	'brep':	'application/octet-stream',
+}
+MAX_BODY = 1024*1024
+
+
+# REQUESTS
+
+def toValue(v):
+	if isinstance(v, list) and len(v) in (2, 3):
+		return Vec2(*v) if len(v) == 2 else Vec3(*v)
+	return v
+
+
+def getJob(req:dict) -> tuple:
+	'''
+	Return the (fn, kwargs) to build for a request. Raises ValueError,
+	KeyError or TypeError for requests that don't describe a key.
+	'''
+	profile = req.get('profile', 'GLK')
+	mx = bool(req.get('mx', False))
+	if profile == 'GLKS':
+		if 'label' in req:
+			return GLKsimple.keycap, GLKsimple.profileArgs(mx)[req['label']]
+		args = req.get('args', {})
+		unknown = set(args)-set(GLKsimple.keycap.__code__.co_varnames[:GLKsimple.keycap.__code__.co_argcount])
+		if unknown:
+			raise ValueError('unknown GLKS arguments: {0}'.format(', '.join(sorted(unknown))))
+		return GLKsimple.keycap, args
+	if profile != 'GLK':
+		raise ValueError("unknown profile '{0}'".format(profile))
+	if 'label' in req:
+		return GLK.keycap, vars(GLK.profileSpecs(mx)[req['label']])
+	row = req.get('row', 'R2')
+	if row not in GLK.rows:
+		raise ValueError("unknown row '{0}'".format(row))
+	tag = req.get('tag')
+	if tag is not None and tag not in layout.TAGS:
+		raise ValueError("unknown tag '{0}'".format(tag))
+	rspec = GLK.getRowSpec(row, mx)
+	params = { 'size':{'units':Vec2(*req.get('units', (1, 1)))} } | layout.getTagParams(tag, rspec)
+	for key in ('body', 'mount', 'mark'):
+		overrides = { k: toValue(v) for k, v in req.get(key, {}).items() }
+		unknown = set(overrides)-set(getattr(rspec, key).fields)
+		if unknown:
+			raise ValueError('unknown {0} settings: {1}'.format(key, ', '.join(sorted(unknown))))
+		if key == 'mark' and 'shape' in overrides:
+			overrides['shape'] = KeyMarkShape[str(overrides['shape']).upper()]
+		if overrides:
+			params[key] = params.get(key, {}) | overrides
+	return GLK.keycap, vars(GLK.apply2spec(rspec, params))
+
+
+# WORKERS
+
+def warmup() -> int:
+	# the first build in a fresh worker pays for imports and memoized components
+	GLK.keycap(fidelity='draft')
+	return os.getpid()
+
+
+def convertJob(data:bytes, fmt:str, tolerance:float, angularTolerance:float) -> bytes:
+	model = brep2shape(data)
+	if fmt == 'stl':
+		return mesh.toSTL(*mesh.tessellate(model, tolerance, angularTolerance, adaptive=True))
+	if fmt == 'ply':
+		return mesh.toPLY(*mesh.weld(*mesh.tessellate(model, tolerance, angularTolerance, adaptive=True)))
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'keycap.step')
+		exporters.export(model, path)
+		with open(path, 'rb') as f:
+			return f.read()
+
+
+# SERVICE
+
+class BuildService:
+
+	def __init__(self, workers:int=2, cache:BrepCache=None, maxResults:int=256, tolerance:float=0.005, angularTolerance:float=0.05, checkInterval:float=2.0):
+		self.workers = workers
+		self.pool = self.makePool()
+		self.sources = self.getSources() # generator -> source version the pool runs
+		self.checkInterval = checkInterval
+		self.checked = monotonic()
+		self.io = ThreadPoolExecutor(max_workers=1) # disk cache reads/writes, one at a time
+		self.cache = cache
+		self.maxResults = maxResults
+		self.tolerance = tolerance
+		self.angularTolerance = angularTolerance
+		self.results = OrderedDict() # (job key, format) -> bytes
+		self.pending = {} # (job key, format) -> task
+		self.running = Counter() # pool -> runs pinned to it, so a replaced pool is only shut down once they're done
+		self.stats = Counter()
+
+	def makePool(self) -> ProcessPoolExecutor:
+		return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+	def getSources(self) -> dict:
+		return { fn: getSourceVersion(fn) for fn in GENERATORS }
+
+	async def warmup(self):
+		loop = asyncio.get_running_loop()
+		await asyncio.gather(*[loop.run_in_executor(self.pool, warmup) for _ in range(self.workers)])
+
+	def checkSource(self):
+		'''
+		Replace the worker pool if the source changed since it was started.
+		Builds already started finish on the old pool, under their old keys.
+		'''
+		if self.checkInterval is None or monotonic()-self.checked < self.checkInterval:
+			return
+		self.checked = monotonic()
+		sources = self.getSources()
+		if sources == self.sources:
+			return
+		old, self.pool = self.pool, self.makePool()
+		self.release(old)
+		self.sources = sources
+		self.results.clear() # all keyed to the old source
+		self.stats['reloads'] += 1
+		asyncio.ensure_future(self.warmup())
+
+	def release(self, pool:ProcessPoolExecutor):
+		if pool is not self.pool and not self.running[pool]:
+			del self.running[pool]
+			pool.shutdown(wait=False)
+
+	def close(self):
+		for pool in {self.pool} | set(self.running):
+			pool.shutdown(cancel_futures=True)
+		self.io.shutdown()
+
+	async def get(self, fn, kwargs:dict, fmt:str) -> tuple:
+		'''
+		Return the model built by fn(**kwargs) as fmt bytes, along with its job
+		key and whether it was a cache hit, a new build or joined a running one.
+		'''
+		self.checkSource()
+		return await self.getOn(self.pool, self.sources[fn], fn, kwargs, fmt)
+
+	async def getOn(self, pool:ProcessPoolExecutor, source:str, fn, kwargs:dict, fmt:str) -> tuple:
+		# get(), pinned to a pool and the source version its workers run
+		key = (getJobKey(fn, kwargs, source), fmt)
+		if key in self.results:
+			self.results.move_to_end(key)
+			self.stats['hits'] += 1
+			return self.results[key], key[0], 'hit'
+		if key in self.pending:
+			self.stats['joined'] += 1
+			return await asyncio.shield(self.pending[key]), key[0], 'joined'
+		self.stats['misses'] += 1
+		self.running[pool] += 1 # before the task starts, so checkSource() can't shut pool down first
+		self.pending[key] = asyncio.ensure_future(self.run(key, pool, source, fn, kwargs))
+		return await asyncio.shield(self.pending[key]), key[0], 'miss'
+
+	async def run(self, key:tuple, pool:ProcessPoolExecutor, source:str, fn, kwargs:dict) -> bytes:
+		loop = asyncio.get_running_loop()
+		jobKey, fmt = key
+		try:
+			if fmt != 'brep':
+				data, _, _ = await self.getOn(pool, source, fn, kwargs, 'brep') # other formats share one build
+				data = await loop.run_in_executor(pool, convertJob, data, fmt, self.tolerance, self.angularTolerance)
+			else:
+				data = await loop.run_in_executor(self.io, self.cache.getBrep, jobKey) if self.cache is not None else None
+				if data is None:
+					data, _ = await loop.run_in_executor(pool, buildJob, fn, kwargs)
+					self.stats['builds'] += 1
+					if self.cache is not None: await loop.run_in_executor(self.io, self.cache.putBrep, jobKey, data)
+			self.results[key] = data
+			if len(self.results) > self.maxResults:
+				self.results.popitem(last=False)
+			return data
+		finally:
+			del self.pending[key]
+			self.running[pool] -= 1
+			self.release(pool)
+
+	def report(self) -> dict:
+		return dict(self.stats) | {
+			'results':	len(self.results),
+			'pending':	len(self.pending),
+			'workers':	self.workers,
+		}
+
+
+# HTTP
+
+async def readRequest(reader:asyncio.StreamReader) -> tuple:
+	line = await reader.readline()
+	if not line:
+		return None
+	method, target, _ = line.decode('latin-1').split(' ', 2)
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in (b'\r\n', b'\n', b''):
+			break
+		name, _, value = line.decode('latin-1').partition(':')
+		headers[name.strip().lower()] = value.strip()
+	length = int(headers.get('content-length', 0))
+	if length > MAX_BODY:
+		raise ValueError('request body too large')
+	body = await reader.readexactly(length) if length else b''
+	return method, target, headers, body
+
+
+def writeResponse(writer:asyncio.StreamWriter, status:int, body:bytes, contentType:str='application/json', headers:dict={}, close:bool=False):
+	reasons = { 200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed', 500:'Internal Server Error' }
+	head = ['HTTP/1.1 {0} {1}'.format(status, reasons.get(status, '')), 'Content-Type: ' + contentType, 'Content-Length: {0}'.format(len(body))]
+	head += ['{0}: {1}'.format(k, v) for k, v in headers.items()]
+	head += ['Connection: close' if close else 'Connection: keep-alive']
+	writer.write(('\r\n'.join(head)+'\r\n\r\n').encode('latin-1') + body)
+
+
+def toJSON(obj) -> bytes:
+	return json.dumps(obj).encode('utf-8')
+
+
+async def handle(service:BuildService, method:str, target:str, body:bytes) -> tuple:
+	'''
+	Return (status, body, content type, headers) for one request.
+	'''
+	url = urlsplit(target)
+	query = { k: v[-1] for k, v in parse_qs(url.query).items() }
+	if url.path == '/health':
+		return 200, toJSON({ 'ok':True }), 'application/json', {}
+	if url.path == '/stats':
+		return 200, toJSON(service.report()), 'application/json', {}
+	if url.path != '/build':
+		return 404, toJSON({ 'error':'no such endpoint' }), 'application/json', {}
+	if method != 'POST':
+		return 405, toJSON({ 'error':'use POST' }), 'application/json', {}
+	try:
+		req = json.loads(body or b'{}')
+		fmt = query.get('format', req.get('format', 'stl')).lower()
+		if fmt not in FORMATS:
+			raise ValueError("unknown format '{0}'".format(fmt))
+		fn, kwargs = getJob(req)
+	except (ValueError, KeyError, TypeError, AttributeError) as e:
+		return 400, toJSON({ 'error':'bad request: {0}'.format(e) }), 'application/json', {}
+	start = perf_counter()
+	try:
+		data, key, status = await service.get(fn, kwargs, fmt)
+	except Exception as e:
+		return 500, toJSON({ 'error':'build failed: {0}'.format(e) }), 'application/json', {}
+	return 200, data, FORMATS[fmt], { 'X-Build-Key':key, 'X-Cache':status, 'X-Time-Ms':'{0:.1f}'.format((perf_counter()-start)*1000) }
+
+
+async def serveClient(service:BuildService, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+	try:
+		while True:
+			try:
+				request = await readRequest(reader)
+			except (ValueError, asyncio.IncompleteReadError) as e:
+				writeResponse(writer, 400, toJSON({ 'error':str(e) }), close=True)
+				break
+			if request is None:
+				break
+			method, target, headers, body = request
+			close = headers.get('connection', '').lower() == 'close'
+			status, data, contentType, extra = await handle(service, method, target, body)
+			writeResponse(writer, status, data, contentType, extra, close)
+			await writer.drain()
+			if close:
+				break
+	except ConnectionError:
+		pass
+	finally:
+		writer.close()
+
+
+async def serve(host:str, port:int, service:BuildService, warm:bool=True):
+	if warm:
+		t = perf_counter()
+		await service.warmup()
+		print('warmed up {0} workers in {1:.2f}s'.format(service.workers, perf_counter()-t))
+	server = await asyncio.start_server(lambda r, w : serveClient(service, r, w), host, port)
+	print('serving on http://{0}:{1}'.format(host, port))
+	async with server:
+		await server.serve_forever()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Local HTTP service building GLK and GLK-S keycaps on a warm worker pool.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--workers', type=int, default=2, help='build processes')
+	parser.add_argument('--cache', help='BREP cache directory, kept across restarts')
+	parser.add_argument('--max-results', type=int, default=256, help='finished files kept in memory')
+	parser.add_argument('--tolerance', type=float, default=0.005, help='max mesh deviation (mm)')
+	parser.add_argument('--angular-tolerance', type=float, default=0.05, help='coarsest angular mesh step (rad)')
+	parser.add_argument('--no-warmup', action='store_true', help="don't build a draft cap in every worker at startup")
+	parser.add_argument('--reload-check', type=float, default=2.0, help='seconds between checks for source changes')
+	args = parser.parse_args()
+
+	service = BuildService(args.workers, BrepCache(args.cache) if args.cache else None, args.max_results, args.tolerance, args.angular_tolerance, args.reload_check)
+	try:
+		asyncio.run(serve(args.host, args.port, service, not args.no_warmup))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		service.close()
@@ -0,0 +1,6 @@
+import sys
+from os.path import dirname, abspath, join
+
+
+# scripts and the keycap package live in src/, which is where they're run from
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
@@ -0,0 +1,178 @@
+import os
+import pickle
+import pytest
+from keycap import cache
+from keycap.helper import KeyMarkSpec, KeyMarkShape
+from keycap.vector import Vec2
+
+
+class Model:
+	# stands in for a built shape; BREP (de)serialization is swapped for pickle
+	def __init__(self, value):
+		self.value = value
+
+	def val(self):
+		return self
+
+
+@pytest.fixture(autouse=True)
+def fakeBrep(monkeypatch):
+	monkeypatch.setattr(cache, 'shape2brep', lambda m : pickle.dumps(m.value))
+	monkeypatch.setattr(cache, 'brep2shape', lambda d : Model(pickle.loads(d)))
+
+
+def getBankFiles(path) -> list:
+	return sorted(f for f in os.listdir(path / cache.ModelBank.DIR) if f.endswith('.brep'))
+
+
+# HASHING
+
+def test_canonical_ignores_number_spelling_and_order():
+	assert cache.getHash({ 'a':1, 'b':[2, 3] }) == cache.getHash({ 'b':[2.0, 3.0], 'a':1.0 })
+	assert cache.getHash({ 'a':1 }) != cache.getHash({ 'a':1.5 })
+	assert cache.getHash([1, 2]) != cache.getHash([2, 1])
+
+
+def test_canonical_values():
+	assert cache.canonical(Vec2(1, 2)) == [1.0, 2.0]
+	assert cache.canonical(KeyMarkShape.DOTS) == 'KeyMarkShape.DOTS'
+	assert cache.canonical((True, None, 'x')) == [True, None, 'x']
+	with pytest.raises(TypeError):
+		cache.canonical({1, 2})
+
+
+def test_canonical_specs():
+	spec = KeyMarkSpec(shape=KeyMarkShape.DOTS, offset=Vec2(y=1))
+	assert cache.getHash(spec) == cache.getHash(spec.clone(offset=Vec2(0, 1.0)))
+	assert cache.getHash(spec) != cache.getHash(spec.clone(shape=KeyMarkShape.WINDOWS))
+
+
+def test_job_key_includes_source():
+	key = cache.getJobKey(getBankFiles, { 'a':1 })
+	assert key == cache.getJobKey(getBankFiles, { 'a':1.0 })
+	assert key == cache.getJobKey(getBankFiles, { 'a':1 }, cache.getSourceVersion(getBankFiles))
+	assert key != cache.getJobKey(getBankFiles, { 'a':1 }, 'other source')
+	assert key != cache.getJobKey(test_job_key_includes_source, { 'a':1 })
+
+
+# BREP CACHE
+
+def test_cache_round_trip(tmp_path):
+	c = cache.BrepCache(str(tmp_path))
+	assert c.get('k') is None
+	c.put('k', Model(1))
+	assert c.get('k').value == 1
+	assert (c.hits, c.misses, c.stores) == (1, 1, 1)
+	assert cache.BrepCache(str(tmp_path)).size == c.size > 0
+
+
+def test_cache_drops_corrupt_entry(tmp_path):
+	c = cache.BrepCache(str(tmp_path))
+	c.putBrep('k', b'truncated')
+	assert c.get('k') is None
+	assert not os.path.exists(c.getPath('k'))
+	assert (c.hits, c.misses, c.size) == (0, 1, 0)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+	c = cache.BrepCache(str(tmp_path), maxBytes=250)
+	for i, key in enumerate('abc'):
+		c.putBrep(key, b'x'*100)
+		os.utime(c.getPath(key), (i, i))
+	assert c.getBrep('a') is None
+	assert c.getBrep('b') == c.getBrep('c') == b'x'*100
+	assert (c.size, c.evictions) == (200, 1)
+
+
+def test_cache_only_scans_when_full(tmp_path, monkeypatch):
+	c = cache.BrepCache(str(tmp_path), maxBytes=250)
+	scans = []
+	monkeypatch.setattr(c, 'evict', lambda : scans.append(1))
+	c.putBrep('a', b'x'*100)
+	c.putBrep('a', b'x'*200) # replacing an entry counts only the difference
+	assert scans == [] and c.size == 200
+	c.putBrep('b', b'x'*100)
+	assert scans == [1]
+
+
+def test_build_uses_cache(tmp_path):
+	c = cache.BrepCache(str(tmp_path))
+	calls = []
+	def make(n=1):
+		calls.append(n)
+		return Model(n)
+	assert cache.build(make, c, n=2).value == 2
+	assert cache.build(make, c, n=2.0).value == 2
+	assert calls == [2]
+
+
+# MODEL BANK
+
+def test_bank_reloads_from_disk(tmp_path):
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	bank.put('leg', Model(1))
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	assert 'leg' in bank
+	assert bank.get('leg').value == 1
+	assert bank.diskHits == 1
+
+
+def test_bank_version_change_deletes_its_files(tmp_path):
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	bank.put('leg', Model(1))
+	assert len(getBankFiles(tmp_path)) == 1
+	bank = cache.ModelBank(path=str(tmp_path), version='b')
+	assert bank.get('leg') is None
+	assert getBankFiles(tmp_path) == []
+
+
+def test_bank_leaves_other_files_alone(tmp_path):
+	# e.g. a BrepCache in the same directory, or files someone else put there
+	brepCache = cache.BrepCache(str(tmp_path))
+	brepCache.putBrep('f'*64, b'cap')
+	os.makedirs(tmp_path / cache.ModelBank.DIR)
+	(tmp_path / cache.ModelBank.DIR / 'mine.brep').write_bytes(b'x')
+	cache.ModelBank(path=str(tmp_path), version='a').put('leg', Model(1))
+	cache.ModelBank(path=str(tmp_path), version='b')
+	assert brepCache.getBrep('f'*64) == b'cap'
+	assert getBankFiles(tmp_path) == ['mine.brep']
+
+
+def test_bank_index_replay(tmp_path):
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	bank.put('a', Model(1))
+	bank.put('b', Model(2))
+	bank.put('a', Model(3))
+	bank.remove('b')
+	with open(bank._getIndexPath(), 'a') as f:
+		f.write('{"name": "c", "fi') # torn by an interrupted run
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	assert bank.get('a').value == 3
+	assert 'b' not in bank and 'c' not in bank
+	assert len(getBankFiles(tmp_path)) == 1
+	with open(bank._getIndexPath()) as f:
+		assert len(f.readlines()) == 2 # compacted to the header and one entry
+
+
+def test_bank_drops_corrupt_and_missing_files(tmp_path, monkeypatch):
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	bank.put('a', Model(1))
+	bank.put('b', Model(2))
+	os.remove(bank._getPath(bank.index['b']['file']))
+	bank = cache.ModelBank(path=str(tmp_path), version='a')
+	assert 'b' not in bank
+	with open(bank._getPath(bank.index['a']['file']), 'wb') as f:
+		f.write(b'not a pickle')
+	assert bank.get('a') is None
+	assert 'a' not in bank
+
+
+def test_bank_evicts_least_recently_used(tmp_path):
+	size = len(pickle.dumps(b'x'*100))
+	bank = cache.ModelBank(path=str(tmp_path), version='a', maxBytes=2*size)
+	for i, name in enumerate('abc'):
+		bank.put(name, Model(b'x'*100))
+		os.utime(bank._getPath(bank.index[name]['file']), (i, i))
+	assert sorted(bank.index) == ['b', 'c']
+	assert bank.size == 2*size
+	assert bank.evictions == 1
@@ -0,0 +1,80 @@
+import pytest
+import layout
+
+
+TABLE = '''
+R4	1*13 2
+R3	1.5 1*12 1.5
+R2	1.75 1*3 1:home 1*2 1:home 1*3 2.25	# comment
+R1	2.25 1*10 2.75
+R1	1.25*3 6.25:space 1.25:windows 1.25*3
+'''
+
+# a 5 row block with a staggered column, then a rotated thumb cluster listed
+# after it, like KLE's ErgoDox preset; raw data with unquoted names
+KLE = '''
+["Esc","1","2"],
+["Tab","Q",{y:-0.25},"W",{y:0.25}],
+["Caps",{n:true},"A","S"],
+["Shift","Z","X"],
+["Ctrl","Win",{w:2},"Space"],
+[{r:30,rx:6.5,ry:4.25,y:-1,x:1},"Alt","Home"],
+[{h:2},"BS",{h:2},"Del","End"]
+'''
+
+
+def test_table_rows_and_units():
+	keys = layout.parseTable(TABLE)
+	assert len(keys) == 14 + 14 + 12 + 12 + 8
+	assert [k[0] for k in keys[:14]] == ['R4']*14
+	assert keys[13][1].toTuple() == (2, 1)
+	assert [k[2] for k in keys if k[2]] == ['home', 'home', 'space', 'windows']
+
+
+def test_table_positions():
+	keys = layout.parseTable(TABLE)
+	assert keys[0][3].toTuple() == (0, 0)
+	assert keys[14][3].toTuple() == (0, 1)
+	assert keys[15][3].toTuple() == (1.5, 1) # after the 1.5U tab
+	assert keys[-1][3].toTuple() == (1.25*3 + 6.25 + 1.25*3, 4)
+
+
+def test_table_errors():
+	with pytest.raises(ValueError, match='line 1'):
+		layout.parseTable('R5	1')
+	with pytest.raises(ValueError, match="can't read key"):
+		layout.parseTable('R1	1:nope')
+
+
+def test_kle_rows_from_block_position():
+	keys = layout.parseKLE(KLE, rotatedRow='R3')
+	rows = { k[3].toTuple(): k[0] for k in keys if k[3].x < 6 }
+	assert rows[(0, 0)] == 'R4'
+	assert rows[(0, 1)] == 'R3'
+	assert rows[(2, 0.75)] == 'R3' # staggered key stays in its row
+	assert rows[(0, 2)] == 'R2'
+	assert rows[(0, 3)] == 'R1'
+	assert rows[(0, 4)] == 'R1'
+
+
+def test_kle_tags():
+	keys = layout.parseKLE(KLE, rotatedRow='R3')
+	tags = { k[3].toTuple(): k[2] for k in keys if k[2] }
+	assert tags == { (1, 2):'home', (1, 4):'windows' }
+
+
+def test_kle_rotated_cluster():
+	with pytest.raises(ValueError, match='rotated'):
+		layout.parseKLE(KLE)
+	keys = layout.parseKLE(KLE, rotatedRow='R3')
+	thumbs = [k for k in keys if k[3].x >= 6]
+	assert len(keys) == 15 + 5
+	assert [k[0] for k in thumbs] == ['R3']*5
+	# placed from the rotation origin, clear of the block
+	assert [k[3].toTuple() for k in thumbs] == [(7.5, 3.25), (8.5, 3.25), (6.5, 4.25), (7.5, 4.25), (8.5, 4.25)]
+	assert thumbs[2][1].toTuple() == (1, 2)
+
+
+def test_kle_profile_names_row():
+	keys = layout.parseKLE(KLE.replace('{r:30,', '{p:"DSA R2",r:30,'))
+	assert [k[0] for k in keys if k[3].x >= 6] == ['R2']*5
@@ -0,0 +1,86 @@
+import numpy as np
+from keycap import mesh
+
+
+# a unit cube as 6 separately meshed faces, like tessellate() returns
+def makeCube() -> tuple:
+	corners = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=float)
+	quads = [(0,1,3,2), (4,6,7,5), (0,4,5,1), (2,3,7,6), (0,2,6,4), (1,5,7,3)]
+	vertices, triangles = [], []
+	for q in quads:
+		n = len(vertices)
+		vertices += [corners[i] for i in q]
+		triangles += [(n, n+1, n+2), (n, n+2, n+3)]
+	return np.array(vertices), np.array(triangles)
+
+
+def test_weld_merges_shared_corners():
+	vertices, triangles = mesh.weld(*makeCube())
+	assert len(vertices) == 8
+	assert len(triangles) == 12
+
+
+def test_weld_drops_collapsed_triangles():
+	vertices = np.array([(0, 0, 0), (1, 0, 0), (1e-9, 0, 0), (0, 1, 0)])
+	_, triangles = mesh.weld(vertices, np.array([(0, 1, 3), (0, 2, 3)]))
+	assert len(triangles) == 1
+
+
+def test_closed_mesh_has_no_open_edges():
+	_, triangles = mesh.weld(*makeCube())
+	assert len(mesh.getOpenEdges(triangles)) == 0
+
+
+def test_open_edges_found():
+	_, triangles = mesh.weld(*makeCube())
+	assert len(mesh.getOpenEdges(triangles[:-1])) == 3 # one triangle missing
+
+
+def test_t_junction_is_open():
+	# one face split with an extra node on a shared edge, as per-face meshing does
+	vertices, triangles = makeCube()
+	vertices = np.vstack([vertices, [(0, 0, 0.5)]])
+	triangles = np.vstack([triangles[2:], [(0, 24, 3), (24, 1, 2), (24, 2, 3)]])
+	_, welded = mesh.weld(vertices, triangles)
+	assert len(mesh.getOpenEdges(welded)) > 0
+
+
+# WRITERS
+
+def test_stl_layout():
+	vertices, triangles = makeCube()
+	data = mesh.toSTL(vertices, triangles, b'cube')
+	assert len(data) == 80 + 4 + 50*len(triangles)
+	assert data[:80] == b'cube'.ljust(80, b'\0')
+	assert np.frombuffer(data[80:84], '<u4')[0] == len(triangles)
+	records = np.frombuffer(data[84:], mesh.STL_DTYPE)
+	assert np.allclose(records['vertices'], vertices[triangles])
+	assert np.all(records['attr'] == 0)
+	assert np.allclose(records['normal'][0], (-1, 0, 0)) # x=0 face, wound to face outwards
+
+
+def test_stl_degenerate_normal():
+	data = mesh.toSTL(np.zeros((3,3)), np.array([(0, 1, 2)]))
+	assert np.all(np.frombuffer(data[84:], mesh.STL_DTYPE)['normal'] == 0)
+
+
+def test_ply_layout():
+	vertices, triangles = mesh.weld(*makeCube())
+	data = mesh.toPLY(vertices, triangles)
+	header, body = data.split(b'end_header\n', 1)
+	lines = header.decode('ascii').splitlines()
+	assert lines[:2] == ['ply', 'format binary_little_endian 1.0']
+	assert 'element vertex 8' in lines and 'element face 12' in lines
+	assert len(body) == 8*12 + 12*13
+	assert np.allclose(np.frombuffer(body[:8*12], '<f4').reshape(-1, 3), vertices)
+	faces = np.frombuffer(body[8*12:], mesh.PLY_FACE_DTYPE)
+	assert np.all(faces['count'] == 3)
+	assert np.array_equal(faces['vertices'], triangles)
+
+
+def test_merge_offsets():
+	vertices, triangles = makeCube()
+	v, t = mesh.merge([(vertices, triangles), (vertices, triangles)], [(0, 0, 0), (2, 0, 0)])
+	assert len(v) == 2*len(vertices)
+	assert t.max() == len(v)-1
+	assert np.allclose(v[len(vertices):], vertices + (2, 0, 0))
@@ -0,0 +1,56 @@
+import pytest
+from keycap.plate import Plate, PlatePacker
+from keycap.vector import Vec2, VecArray
+
+
+def test_place_fills_shelf_then_opens_next():
+	p = Plate(Vec2(50, 50))
+	assert p.place('a', Vec2(20, 20), 2)
+	assert p.place('b', Vec2(20, 10), 2) # shallower, same shelf
+	assert p.place('c', Vec2(20, 20), 2)
+	assert p.items['a'].toTuple() == (2, 2)
+	assert p.items['b'].toTuple() == (24, 2)
+	assert p.items['c'].toTuple() == (2, 24)
+	assert len(p) == 3
+
+
+def test_place_respects_edges():
+	p = Plate(Vec2(50, 30))
+	assert not p.place('wide', Vec2(47, 10), 2)
+	assert p.place('a', Vec2(46, 10), 2)
+	assert p.place('b', Vec2(46, 14), 2)
+	assert not p.place('c', Vec2(10, 1), 2)
+
+
+def test_place_deeper_than_shelf_opens_new_one():
+	p = Plate(Vec2(100, 100))
+	p.place('a', Vec2(10, 10), 2)
+	p.place('b', Vec2(10, 20), 2)
+	assert p.items['b'].y == 14
+
+
+def test_pack_biggest_first_and_new_plates():
+	packer = PlatePacker(Vec2(50, 50), spacing=2)
+	plates = packer.pack({ 'small':Vec2(10, 10), 'big':Vec2(46, 46), 'mid':Vec2(20, 20) })
+	assert len(plates) == 2
+	assert list(plates[0].items) == ['big']
+	assert list(plates[1].items) == ['mid', 'small']
+
+
+def test_pack_rejects_oversized():
+	with pytest.raises(ValueError, match='does not fit'):
+		PlatePacker(Vec2(50, 50)).pack({ 'huge':Vec2(60, 10) })
+
+
+def test_layout_moves_min_corner_into_place():
+	packer = PlatePacker(Vec2(50, 50), spacing=2, tilt=0, lift=1)
+	points = VecArray([(-5, -5, -3), (5, 5, 4)])
+	plates, offsets = packer.layout({ 'a':points })
+	assert len(plates) == 1
+	assert points.clone().translate(offsets['a']).getMin().toTuple() == (2, 2, 1)
+
+
+def test_layout_checks_height():
+	packer = PlatePacker(Vec2(50, 50), tilt=0, lift=1, height=5)
+	with pytest.raises(ValueError, match='plate height'):
+		packer.layout({ 'a':VecArray([(0, 0, 0), (1, 1, 5)]) })